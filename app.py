@@ -0,0 +1,221 @@
+"""Headless batch analysis of recorded parking video.
+
+Splits a video into chunks that are decoded and analyzed in parallel worker
+processes, without any drawing or display, and writes a per-frame, per-space
+occupancy timeline plus summary statistics.
+
+    python app.py Media/video4.mp4 --out timeline.npz --workers 8
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+
+import cv2
+import numpy as np
+
+from inference import detect, letterbox_for, model_imgsz
+from layout_store import DEFAULT_CAMERA, load_camera_layout, load_layout
+from occupancy import OCCUPANCY_MODES, OVERLAP_THRESHOLD, compile_layout, detect_occupancy, vehicle_boxes
+
+MODEL_PATH = "Models/yolov8m mAp 48/weights/best.pt"
+# Layouts are drawn on frames of this size, so frames are analyzed at it too
+FRAME_WIDTH = 960
+FRAME_HEIGHT = 540
+INFERENCE_SIZE = None  # None runs the model at the size it was trained at
+# Chunks per worker, so a slow chunk does not leave the other workers idle
+CHUNKS_PER_WORKER = 4
+
+# Per-process model, loaded once by the pool initializer
+_model = None
+
+
+def _init_worker(model_path, threads):
+    """Load the model once in each worker process."""
+    global _model
+    import torch
+    from ultralytics import YOLO
+
+    # One pool of threads per process instead of every process using every core
+    torch.set_num_threads(threads)
+    _model = YOLO(model_path)
+
+
+def _process_chunk(task):
+    """Analyze frames [start, stop) of the video and return their occupancy rows."""
+    video_path, start, stop, stride, polygon_data, meta, mode, threshold = task
+    layout = compile_layout(polygon_data, meta)
+
+    cap = cv2.VideoCapture(video_path)
+    # Seeking decodes forward from the nearest keyframe before `start`
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    frame = None
+    resized = np.empty((FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)
+    letterbox = letterbox_for((FRAME_WIDTH, FRAME_HEIGHT), model_imgsz(_model, INFERENCE_SIZE))
+    indices = []
+    rows = []
+
+    for index in range(start, stop):
+        if index % stride:
+            # Skipped frames are still demuxed/decoded but never converted or analyzed
+            if not cap.grab():
+                break
+            continue
+
+        ret, frame = cap.read(frame)
+        if not ret:
+            break
+
+        cv2.resize(frame, (FRAME_WIDTH, FRAME_HEIGHT), dst=resized)
+        results = detect(_model, letterbox, resized)
+        rows.append(detect_occupancy(vehicle_boxes(results), layout, mode, threshold))
+        indices.append(index)
+
+    cap.release()
+    occupied = np.array(rows, dtype=bool).reshape(len(rows), layout.size)
+    return np.array(indices, dtype=np.int64), occupied
+
+
+def split_chunks(frame_count, chunk_count, stride):
+    """Split [0, frame_count) into contiguous chunks aligned to the stride."""
+    chunk_size = -(-frame_count // max(chunk_count, 1))
+    chunk_size = max(stride, -(-chunk_size // stride) * stride)
+    return [(start, min(start + chunk_size, frame_count))
+            for start in range(0, frame_count, chunk_size)]
+
+
+def analyze_video(video_path, polygon_data, workers=None, stride=1, model_path=MODEL_PATH,
+                  meta=None, mode="center", threshold=OVERLAP_THRESHOLD):
+    """Compute the occupancy timeline of a recorded video.
+
+    Returns a dict with the analyzed frame indices, their timestamps in
+    seconds, the (frames, spaces) boolean occupancy matrix and the video fps.
+    """
+    if not polygon_data:
+        raise ValueError("Layout has no parking spaces")
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video {video_path}")
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    cap.release()
+
+    workers = workers or os.cpu_count() or 1
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    chunks = split_chunks(frame_count, workers * CHUNKS_PER_WORKER, stride)
+    tasks = [(video_path, start, stop, stride, polygon_data, meta, mode, threshold)
+             for start, stop in chunks]
+
+    indices = []
+    rows = []
+    with mp.Pool(workers, initializer=_init_worker, initargs=(model_path, threads)) as pool:
+        # imap keeps chunk order, so the merged timeline stays sorted
+        for chunk_indices, chunk_rows in pool.imap(_process_chunk, tasks):
+            indices.append(chunk_indices)
+            rows.append(chunk_rows)
+
+    frames = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64)
+    occupied = np.concatenate(rows) if rows else np.zeros((0, len(polygon_data)), dtype=bool)
+    return {
+        'frame': frames,
+        'time_s': frames / fps,
+        'occupied': occupied,
+        'fps': fps,
+    }
+
+
+def save_timeline(path, timeline):
+    """Write the timeline as compressed columns, with occupancy packed to one bit per space."""
+    occupied = timeline['occupied']
+    np.savez_compressed(
+        path,
+        frame=timeline['frame'].astype(np.int32),
+        time_s=timeline['time_s'].astype(np.float32),
+        free=(occupied.shape[1] - occupied.sum(axis=1)).astype(np.uint32),
+        occupied=np.packbits(occupied, axis=1),
+        spaces=np.int32(occupied.shape[1]),
+        fps=np.float32(timeline['fps']),
+    )
+
+
+def load_timeline(path):
+    """Read a timeline written by save_timeline."""
+    with np.load(path) as data:
+        spaces = int(data['spaces'])
+        return {
+            'frame': data['frame'],
+            'time_s': data['time_s'],
+            'free': data['free'],
+            'occupied': np.unpackbits(data['occupied'], axis=1, count=spaces).astype(bool),
+            'fps': float(data['fps']),
+        }
+
+
+def summarize(timeline):
+    """Return summary statistics of an occupancy timeline."""
+    occupied = timeline['occupied']
+    frames, spaces = occupied.shape
+    if frames == 0:
+        return {'frames': 0, 'spaces': spaces}
+
+    occupied_count = occupied.sum(axis=1)
+    rate = occupied_count / spaces * 100
+    return {
+        'frames': frames,
+        'spaces': spaces,
+        'duration_s': round(float(timeline['time_s'][-1] - timeline['time_s'][0]), 2),
+        'mean_occupied': round(float(occupied_count.mean()), 2),
+        'min_occupied': int(occupied_count.min()),
+        'max_occupied': int(occupied_count.max()),
+        'mean_occupancy_rate': round(float(rate.mean()), 1),
+        'peak_time_s': round(float(timeline['time_s'][occupied_count.argmax()]), 2),
+        # Fraction of analyzed frames each space was occupied
+        'space_occupancy': [round(float(v), 3) for v in occupied.mean(axis=0)],
+        # Number of free/occupied changes per space
+        'space_transitions': np.count_nonzero(np.diff(occupied, axis=0), axis=0).tolist(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless occupancy analysis of a recorded video")
+    parser.add_argument("video", help="Path of the video file")
+    parser.add_argument("--camera", default=DEFAULT_CAMERA, help="Camera whose layout is used")
+    parser.add_argument("--layout", default=None, help="Layout file, instead of the camera layout")
+    parser.add_argument("--model", default=MODEL_PATH, help="YOLO weights")
+    parser.add_argument("--out", default="timeline.npz", help="Output timeline file")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--stride", type=int, default=1, help="Analyze every Nth frame")
+    parser.add_argument("--mode", choices=OCCUPANCY_MODES, default="center", help="Occupancy test")
+    parser.add_argument("--threshold", type=float, default=OVERLAP_THRESHOLD,
+                        help="Default covered fraction of a space in overlap mode")
+    args = parser.parse_args()
+
+    if args.layout:
+        polygon_data, meta = load_layout(args.layout)
+    else:
+        polygon_data, meta = load_camera_layout(args.camera)
+
+    start = time.time()
+    timeline = analyze_video(args.video, polygon_data, args.workers,
+                             max(1, args.stride), args.model, meta, args.mode, args.threshold)
+    elapsed = time.time() - start
+
+    save_timeline(args.out, timeline)
+    summary = summarize(timeline)
+    summary['processing_s'] = round(elapsed, 2)
+    summary['processing_fps'] = round(summary['frames'] / elapsed, 1) if elapsed > 0 else 0
+
+    summary_path = os.path.splitext(args.out)[0] + ".summary.json"
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"Analyzed {summary['frames']} frames in {elapsed:.1f}s "
+          f"({summary['processing_fps']} FPS), timeline written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Incremental auto-layout from the detections of the running pipeline.
+
+Vehicle boxes are clustered online: a box joins the cluster it overlaps most
+(IoU above MATCH_IOU) and moves its running mean, otherwise it starts a new
+cluster. A cluster's dwell grows while it keeps being seen without gaps
+longer than GAP_SECONDS, so passing traffic, even on a busy lane, never
+builds up dwell and its clusters expire. Clusters that once dwelt for at
+least `min_seconds` become proposed spaces after overlapping ones are merged,
+so spaces that are empty right now are still proposed if a car stood there
+earlier.
+"""
+
+import threading
+
+import numpy as np
+
+# A box joins a cluster when their IoU is at least this
+MATCH_IOU = 0.5
+# Proposed spaces overlapping more than this are merged
+MERGE_IOU = 0.3
+# Boxes are sampled at most this often
+SAMPLE_INTERVAL = 1.0
+# Seconds a vehicle must stand in a cluster before it is proposed as a space
+MIN_SECONDS = 300.0
+# Missed detections shorter than this do not interrupt a dwell
+GAP_SECONDS = 10.0
+# Clusters below the persistence threshold are dropped when unseen for this long
+EXPIRE_SECONDS = 120.0
+MAX_CLUSTERS = 5000
+# Pixels added around a proposed space, as in the single-frame auto-detect
+MARGIN = 5
+
+
+def box_iou(boxes, others):
+    """Return the (N, M) IoU matrix of two arrays of x1, y1, x2, y2 boxes."""
+    x1 = np.maximum(boxes[:, None, 0], others[None, :, 0])
+    y1 = np.maximum(boxes[:, None, 1], others[None, :, 1])
+    x2 = np.minimum(boxes[:, None, 2], others[None, :, 2])
+    y2 = np.minimum(boxes[:, None, 3], others[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    other_area = (others[:, 2] - others[:, 0]) * (others[:, 3] - others[:, 1])
+    union = area[:, None] + other_area[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def box_polygon(box, margin=MARGIN):
+    """Return a box as a layout polygon, in the point order of the editor."""
+    x1, y1, x2, y2 = box
+    return [
+        (int(x1 - margin), int(y1 - margin)),
+        (int(x1 - margin), int(y2 + margin)),
+        (int(x2 + margin), int(y2 + margin)),
+        (int(x2 + margin), int(y1 - margin)),
+    ]
+
+
+class AutoLayoutBuilder:
+    """Clusters vehicle boxes over time and proposes parking spaces.
+
+    `update` is called by the video loop with boxes it already has, so no
+    extra inference is run; `proposal` can be read from other threads.
+    """
+
+    def __init__(self, min_seconds=MIN_SECONDS, sample_interval=SAMPLE_INTERVAL,
+                 expire_seconds=EXPIRE_SECONDS, max_clusters=MAX_CLUSTERS):
+        self.min_seconds = min_seconds
+        self.sample_interval = sample_interval
+        self.expire_seconds = expire_seconds
+        self.max_clusters = max_clusters
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget every cluster."""
+        with self.lock:
+            self.boxes = np.zeros((0, 4), np.float64)  # Running mean box of each cluster
+            self.hits = np.zeros(0, np.int64)          # Samples the cluster was seen in
+            self.last_seen = np.zeros(0, np.float64)
+            self.dwell_start = np.zeros(0, np.float64)  # Start of the current dwell
+            self.dwell = np.zeros(0, np.float64)        # Longest dwell in seconds
+            self.samples = 0
+            self.last_sample = None
+            self.cached = None
+
+    def update(self, boxes, ts):
+        """Add the vehicle boxes of a frame taken at `ts`; returns True if sampled."""
+        if not self.enabled:
+            return False
+        if self.last_sample is not None and ts - self.last_sample < self.sample_interval:
+            return False
+
+        boxes = np.asarray(boxes, np.float64).reshape(-1, 4)
+        with self.lock:
+            self.last_sample = ts
+            self.samples += 1
+            self.cached = None
+            if len(boxes) and len(self.boxes):
+                iou = box_iou(boxes, self.boxes)
+                best = iou.argmax(axis=1)
+                matched = iou[np.arange(len(boxes)), best] >= MATCH_IOU
+            else:
+                best = np.zeros(len(boxes), np.int64)
+                matched = np.zeros(len(boxes), bool)
+
+            # A cluster is counted once per sample even if several boxes match it
+            for i in np.flatnonzero(matched):
+                c = best[i]
+                if self.last_seen[c] == ts:
+                    continue
+                if ts - self.last_seen[c] > GAP_SECONDS:
+                    self.dwell_start[c] = ts
+                self.dwell[c] = max(self.dwell[c], ts - self.dwell_start[c])
+                self.hits[c] += 1
+                self.last_seen[c] = ts
+                self.boxes[c] += (boxes[i] - self.boxes[c]) / min(self.hits[c], 1000)
+
+            new = boxes[~matched]
+            if len(new):
+                self.boxes = np.concatenate([self.boxes, new])
+                self.hits = np.concatenate([self.hits, np.ones(len(new), np.int64)])
+                self.last_seen = np.concatenate([self.last_seen, np.full(len(new), ts)])
+                self.dwell_start = np.concatenate([self.dwell_start, np.full(len(new), ts)])
+                self.dwell = np.concatenate([self.dwell, np.zeros(len(new))])
+            self._prune(ts)
+        return True
+
+    def _prune(self, ts):
+        keep = (self.dwell >= self.min_seconds) | (ts - self.last_seen <= self.expire_seconds)
+        if len(keep) - keep.sum() == 0 and len(keep) <= self.max_clusters:
+            return
+        if keep.sum() > self.max_clusters:
+            # Keep the clusters with the most observation time
+            order = np.argsort(-self.hits * keep, kind="stable")[:self.max_clusters]
+            keep = np.zeros(len(keep), bool)
+            keep[order] = True
+        self.boxes = self.boxes[keep]
+        self.hits = self.hits[keep]
+        self.last_seen = self.last_seen[keep]
+        self.dwell_start = self.dwell_start[keep]
+        self.dwell = self.dwell[keep]
+
+    def proposal(self):
+        """Return the proposed space polygons, longest observed first."""
+        with self.lock:
+            if self.cached is None:
+                self.cached = self._propose()
+            return list(self.cached)
+
+    def _propose(self):
+        stable = np.flatnonzero(self.dwell >= self.min_seconds)
+        if len(stable) == 0:
+            return []
+        order = stable[np.argsort(-self.hits[stable], kind="stable")]
+        boxes = self.boxes[order]
+        weights = self.hits[order].astype(np.float64)
+
+        # Greedy merge: each kept box absorbs the weaker boxes overlapping it
+        iou = box_iou(boxes, boxes)
+        taken = np.zeros(len(boxes), bool)
+        spaces = []
+        for i in range(len(boxes)):
+            if taken[i]:
+                continue
+            group = np.flatnonzero(~taken & (iou[i] > MERGE_IOU))
+            taken[group] = True
+            merged = np.average(boxes[group], axis=0, weights=weights[group])
+            spaces.append(box_polygon(merged))
+        return spaces
+
+    def status(self):
+        """Return a summary of the builder for the control API."""
+        spaces = self.proposal()
+        with self.lock:
+            stable = int((self.dwell >= self.min_seconds).sum())
+            return {
+                'enabled': self.enabled,
+                'samples': self.samples,
+                'clusters': len(self.hits),
+                'stable_clusters': stable,
+                'min_seconds': self.min_seconds,
+                'spaces': spaces,
+            }
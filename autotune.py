@@ -0,0 +1,188 @@
+"""Choose the cheapest model settings that still read a camera's layout right.
+
+Samples frames of a clip from the camera, takes the occupancy that a large
+input size gives on the full-resolution frames as the reference, then sweeps
+checkpoint, input size and torch thread count the way main1.py runs them. For
+each setting it measures the inference latency and how many space states
+agree with the reference, and writes the fastest setting that meets the
+agreement target into config/<camera>.json.
+
+    python autotune.py Media/video4.mp4 --camera north
+    python autotune.py Media/video4.mp4 --sizes 416 512 640 --threads 1 2 4 --dry-run
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from config import config_path, load_config, save_config
+from inference import detect, letterbox_for, set_threads
+from layout_store import DEFAULT_CAMERA, load_camera_layout
+from occupancy import compile_layout, detect_occupancy, vehicle_boxes
+
+MODELS_GLOB = "Models/*/weights/best.pt"
+SIZES = (320, 416, 480, 512, 640, 768, 960)
+REFERENCE_SIZE = 1280
+# Fraction of (frame, space) states that must match the reference
+TARGET_AGREEMENT = 0.98
+SAMPLE_FRAMES = 40
+STRIDE = 32
+
+
+def training_size(model_path):
+    """Return the imgsz a checkpoint was trained at, from its args.yaml, or None."""
+    path = os.path.join(os.path.dirname(os.path.dirname(model_path)), "args.yaml")
+    try:
+        with open(path) as f:
+            match = re.search(r"^imgsz:\s*(\d+)", f.read(), re.MULTILINE)
+    except OSError:
+        return None
+    return int(match.group(1)) if match else None
+
+
+def sample_frames(clip, count):
+    """Return `count` frames spread evenly over the clip, at full resolution."""
+    cap = cv2.VideoCapture(clip)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video {clip}")
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frames = []
+    for index in np.linspace(0, max(total - 1, 0), count).astype(int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+        ret, frame = cap.read()
+        if ret:
+            frames.append(frame)
+    cap.release()
+    if not frames:
+        raise IOError(f"No frames could be read from {clip}")
+    return frames
+
+
+def run(model, letterbox, frames, layout, mode, threshold):
+    """Return the occupancy of every frame and the per-frame inference times in ms."""
+    occupied, times = [], []
+    for frame in frames:
+        start = time.perf_counter()
+        results = detect(model, letterbox, frame)
+        times.append((time.perf_counter() - start) * 1000)
+        occupied.append(detect_occupancy(vehicle_boxes(results), layout, mode, threshold))
+    return np.array(occupied, dtype=bool), times
+
+
+def autotune(clip, camera, models, sizes, threads, reference_model, reference_size,
+             target, sample_count):
+    """Sweep the settings and return (results, best), best None if none meets the target."""
+    from ultralytics import YOLO
+
+    config = load_config(camera)
+    polygon_data, meta = load_camera_layout(camera)
+    if not polygon_data:
+        raise ValueError(f"Camera {camera} has no parking spaces")
+    layout = compile_layout(polygon_data, meta)
+    mode, threshold = config['occupancy_mode'], float(config['overlap_threshold'])
+    frame_size = (int(config['frame_width']), int(config['frame_height']))
+
+    raw_frames = sample_frames(clip, sample_count)
+    # Candidates see what main1.py sees, the frame resized to the layout's size
+    frames = [cv2.resize(frame, frame_size) for frame in raw_frames]
+
+    # The reference letterboxes the full-resolution frames, boxes come back in layout coordinates
+    print(f"Reference: {reference_model} at {reference_size}px on {len(raw_frames)} frames")
+    set_threads(max(threads))
+    reference, _ = run(YOLO(reference_model), letterbox_for(frame_size, reference_size),
+                       raw_frames, layout, mode, threshold)
+    del raw_frames
+
+    results = []
+    for model_path in models:
+        model = YOLO(model_path)
+        trained = training_size(model_path)
+        model_sizes = set(sizes)
+        if trained:
+            model_sizes.add(-(-trained // STRIDE) * STRIDE)
+        for imgsz in sorted(model_sizes):
+            letterbox = letterbox_for(frame_size, imgsz)
+            agreement = None
+            for thread_count in threads:
+                set_threads(thread_count)
+                run(model, letterbox, frames[:2], layout, mode, threshold)  # Warm-up
+                occupied, times = run(model, letterbox, frames, layout, mode, threshold)
+                if agreement is None:
+                    # Thread count changes the speed, not the detections
+                    agreement = float((occupied == reference).mean())
+                result = {
+                    'model_path': model_path,
+                    'imgsz': imgsz,
+                    'torch_threads': thread_count,
+                    'latency_ms': round(statistics.median(times), 2),
+                    'agreement': round(agreement, 4),
+                }
+                results.append(result)
+                print(f"{model_path} imgsz={imgsz} threads={thread_count}: "
+                      f"{result['latency_ms']:.1f} ms, agreement {agreement:.2%}")
+
+    passing = [r for r in results if r['agreement'] >= target]
+    best = min(passing, key=lambda r: (r['latency_ms'], -r['agreement'])) if passing else None
+    return results, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pick model, input size and threads for a camera")
+    parser.add_argument("clip", help="Sample clip from the camera")
+    parser.add_argument("--camera", default=DEFAULT_CAMERA, help="Camera whose layout and config are used")
+    parser.add_argument("--models", nargs="+", default=None,
+                        help=f"Checkpoints to try (default: {MODELS_GLOB} and the configured model)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Input sizes to try")
+    parser.add_argument("--threads", type=int, nargs="+", default=None,
+                        help="Torch thread counts to try (default: 1, 2, 4, ... up to the CPU count)")
+    parser.add_argument("--reference-model", default=None,
+                        help="Checkpoint of the reference (default: the largest checkpoint)")
+    parser.add_argument("--reference-size", type=int, default=REFERENCE_SIZE, help="Input size of the reference")
+    parser.add_argument("--target", type=float, default=TARGET_AGREEMENT, help="Required agreement, 0.98 = 98%%")
+    parser.add_argument("--frames", type=int, default=SAMPLE_FRAMES, help="Frames sampled from the clip")
+    parser.add_argument("--report", default=None, help="Write every measurement to this JSON file")
+    parser.add_argument("--dry-run", action="store_true", help="Do not write the camera config")
+    args = parser.parse_args()
+
+    models = args.models
+    if models is None:
+        configured = load_config(args.camera)['model_path']
+        models = sorted(set(glob.glob(MODELS_GLOB)) | ({configured} if os.path.exists(configured) else set()))
+    if not models:
+        print("No checkpoints found; pass them with --models")
+        return 1
+    threads = args.threads
+    if threads is None:
+        cpus = os.cpu_count() or 1
+        threads = sorted({min(2 ** i, cpus) for i in range(cpus.bit_length() + 1)})
+    # The largest checkpoint is taken to be the most accurate
+    reference_model = args.reference_model or max(models, key=os.path.getsize)
+    sizes = sorted({-(-size // STRIDE) * STRIDE for size in args.sizes})
+
+    results, best = autotune(args.clip, args.camera, models, sizes, threads, reference_model,
+                             args.reference_size, args.target, args.frames)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({'target': args.target, 'best': best, 'results': results}, f, indent=2)
+
+    if best is None:
+        print(f"No setting reaches {args.target:.0%} agreement; the config is unchanged")
+        return 1
+    print(f"Best: {best['model_path']} imgsz={best['imgsz']} threads={best['torch_threads']} "
+          f"({best['latency_ms']:.1f} ms, agreement {best['agreement']:.2%})")
+    if not args.dry_run:
+        save_config(args.camera, {key: best[key] for key in ('model_path', 'imgsz', 'torch_threads')})
+        print(f"Written to {config_path(args.camera)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+"""Reproducible benchmarks of the occupancy pipeline.
+
+Runs without model weights: inference is replaced by a stub that returns
+synthetic vehicle detections. The end-to-end case runs the FrameProcessor
+of the main1.py video loop around that stub. Results are written as JSON
+and compared with a stored baseline, failing when a case got slower than the
+tolerance allows or when there is no baseline to compare with.
+
+    python benchmark.py --save-baseline          # record a baseline
+    python benchmark.py                          # compare against it
+    python benchmark.py --clip Media/video4.mp4  # end-to-end on a recorded clip
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from buffer_pool import LatestFrame
+from functions import find_polygon_center, is_point_in_polygon
+from metrics import Metrics
+from occupancy import OVERLAP_THRESHOLD, compile_layout, detect_occupancy, vehicle_boxes
+from pipeline import FrameProcessor, encode_jpeg
+from preprocess import Letterbox
+from render import draw_counts, draw_occupancy
+
+BASELINE_PATH = "benchmark_baseline.json"
+RESULTS_PATH = "benchmark_results.json"
+
+LAYOUT_SIZES = (10, 100, 1000, 10000)
+RESOLUTIONS = {'540p': (960, 540), '1080p': (1920, 1080), '4k': (3840, 2160)}
+JPEG_QUALITIES = (50, 70, 90)
+# The per-pair reference matcher is too slow to run on larger layouts
+LEGACY_MAX_SPACES = 1000
+SEED = 0
+
+
+def synthetic_layout(spaces, frame_size, seed=SEED):
+    """Return `spaces` slightly skewed quadrilaterals on a grid covering the frame."""
+    rng = np.random.default_rng(seed)
+    width, height = frame_size
+    cols = int(np.ceil(np.sqrt(spaces * width / height)))
+    rows = int(np.ceil(spaces / cols))
+    cell_w, cell_h = width / cols, height / rows
+
+    polygon_data = []
+    for i in range(spaces):
+        x, y = (i % cols) * cell_w, (i // cols) * cell_h
+        skew = rng.uniform(-0.1, 0.1) * cell_w
+        polygon_data.append([
+            (int(x + 0.1 * cell_w + skew), int(y + 0.1 * cell_h)),
+            (int(x + 0.1 * cell_w), int(y + 0.9 * cell_h)),
+            (int(x + 0.9 * cell_w), int(y + 0.9 * cell_h)),
+            (int(x + 0.9 * cell_w + skew), int(y + 0.1 * cell_h)),
+        ])
+    return polygon_data
+
+
+def synthetic_detections(polygon_data, seed=SEED, occupancy=0.5, limit=300):
+    """Return YOLO-style detection rows (x1, y1, x2, y2, score, class) over some spaces."""
+    rng = np.random.default_rng(seed)
+    count = min(int(len(polygon_data) * occupancy), limit)
+    chosen = rng.choice(len(polygon_data), size=count, replace=False) if count else []
+    rows = []
+    for i in chosen:
+        points = np.array(polygon_data[i])
+        (x1, y1), (x2, y2) = points.min(axis=0), points.max(axis=0)
+        jitter = rng.uniform(-2, 2, size=4)
+        rows.append([x1 + jitter[0], y1 + jitter[1], x2 + jitter[2], y2 + jitter[3],
+                     rng.uniform(0.3, 1.0), rng.choice([2, 3, 4, 5, 8, 9])])
+    return np.array(rows, dtype=np.float32).reshape(-1, 6)
+
+
+class StubBoxes:
+    def __init__(self, data):
+        self.data = data
+
+
+class StubResult:
+    def __init__(self, data):
+        self.boxes = StubBoxes(data)
+
+
+class StubModel:
+    """Stands in for YOLO and always returns the same detections."""
+
+    def __init__(self, detections):
+        self.results = [StubResult(detections)]
+
+    def __call__(self, frame, **kwargs):
+        return self.results
+
+
+def legacy_match(detections, polygon_data):
+    """Per-pair matching as originally done in the interactive loop."""
+    free = list(polygon_data)
+    for x1, y1, x2, y2, score, class_id in detections.tolist():
+        car_polygon = [(int(x1), int(y1)), (int(x1), int(y2)), (int(x2), int(y2)), (int(x2), int(y1))]
+        free = [p for p in free if not is_point_in_polygon(find_polygon_center(p), car_polygon)]
+    return len(polygon_data) - len(free)
+
+
+def measure(fn, repeat, warmup=1):
+    """Run fn and return timing statistics in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return {
+        'median_ms': round(statistics.median(times), 4),
+        'min_ms': round(min(times), 4),
+        'max_ms': round(max(times), 4),
+        'runs': repeat,
+    }
+
+
+def bench_matching(results, repeat):
+    frame_size = RESOLUTIONS['540p']
+    for spaces in LAYOUT_SIZES:
+        polygon_data = synthetic_layout(spaces, frame_size)
+        detections = synthetic_detections(polygon_data)
+        result = StubResult(detections)
+        layout = compile_layout(polygon_data)
+
+        results[f'matching/vectorized/{spaces}'] = measure(
+            lambda: detect_occupancy(vehicle_boxes(result), layout), repeat)
+        layout.overlap_index()
+        results[f'matching/overlap/{spaces}'] = measure(
+            lambda: detect_occupancy(vehicle_boxes(result), layout, "overlap"), repeat)
+        results[f'matching/compile/{spaces}'] = measure(
+            lambda: compile_layout(polygon_data), max(1, repeat // 10))
+        if spaces <= LEGACY_MAX_SPACES:
+            results[f'matching/legacy/{spaces}'] = measure(
+                lambda: legacy_match(detections, polygon_data), max(1, repeat // 10))
+
+
+def bench_render(results, repeat, spaces=100):
+    for name, frame_size in RESOLUTIONS.items():
+        width, height = frame_size
+        frame = np.random.default_rng(SEED).integers(0, 255, (height, width, 3), dtype=np.uint8)
+        layout = compile_layout(synthetic_layout(spaces, frame_size))
+        occupied = np.arange(spaces) % 2 == 0
+
+        def render():
+            drawn = frame.copy()
+            draw_counts(drawn, spaces, spaces // 2)
+            return draw_occupancy(drawn, layout, occupied)
+
+        results[f'render/{name}'] = measure(render, repeat)
+        letterbox = Letterbox(frame_size, 640)
+        results[f'preprocess/{name}'] = measure(lambda: letterbox.fill(frame), repeat)
+
+        for quality in JPEG_QUALITIES:
+            params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+            results[f'encode/{name}/q{quality}'] = measure(
+                lambda: cv2.imencode('.jpg', frame, params), repeat)
+
+
+def synthetic_clip(path, frames=100, frame_size=(1280, 720), fps=25):
+    """Write a short clip with moving noise, so decoding has real work to do."""
+    rng = np.random.default_rng(SEED)
+    width, height = frame_size
+    background = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, frame_size)
+    for i in range(frames):
+        writer.write(np.roll(background, i * 4, axis=1))
+    writer.release()
+
+
+def stub_detect(model, letterbox, frame):
+    """inference.detect without torch: fill the model input, map the boxes back to the frame."""
+    results = model(letterbox.fill(frame))[0]
+    data = results.boxes.data.copy()
+    letterbox.to_frame(data[:, :4])
+    return StubResult(data)
+
+
+def bench_end_to_end(results, clip, spaces=100, frame_size=RESOLUTIONS['540p'], quality=70, imgsz=640):
+    """Run every frame of a clip through the FrameProcessor of main1.py, with stub inference."""
+    polygon_data = synthetic_layout(spaces, frame_size)
+    meta = {'spaces': [{'groups': [f"P{i % 3}/row {i % 10}"]} for i in range(spaces)]}
+    layout = compile_layout(polygon_data, meta)
+    # The stub returns boxes in model input coordinates, as YOLO does
+    letterbox = Letterbox(frame_size, imgsz)
+    detections = synthetic_detections(polygon_data)
+    detections[:, :4] = detections[:, :4] * letterbox.scale + [letterbox.left, letterbox.top] * 2
+    model = StubModel(detections)
+    processor = FrameProcessor(Metrics(sample_every=0), stub_detect)
+    latest = LatestFrame()
+    raw = None
+
+    cap = cv2.VideoCapture(clip)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open clip {clip}")
+    frames = 0
+    start = time.perf_counter()
+    while True:
+        ret, decoded = cap.read(raw)
+        if not ret:
+            break
+        raw = decoded
+        slot, info, _, _ = processor.process(raw, model, layout, frame_size, imgsz, "", "center",
+                                             OVERLAP_THRESHOLD, time.time())
+        latest.publish(slot, info)
+        slot.release()
+
+        # What the streaming thread does with the published frame
+        published, info = latest.take()
+        try:
+            encode_jpeg(published.array, quality)
+        finally:
+            published.release()
+        frames += 1
+    elapsed = time.perf_counter() - start
+    cap.release()
+
+    results['end_to_end/fps'] = {
+        'fps': round(frames / elapsed, 2) if elapsed > 0 else 0,
+        'median_ms': round(elapsed / max(frames, 1) * 1000, 4),
+        'runs': frames,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return (case, baseline_ms, current_ms, ratio) of every case slower than the tolerance."""
+    regressions = []
+    for case, current in sorted(results.items()):
+        previous = baseline.get(case)
+        if not previous or not previous.get('median_ms'):
+            continue
+        ratio = current['median_ms'] / previous['median_ms']
+        print(f"{case:32s} {previous['median_ms']:10.3f} ms -> {current['median_ms']:10.3f} ms  x{ratio:.2f}")
+        if ratio > 1 + tolerance:
+            regressions.append((case, previous['median_ms'], current['median_ms'], ratio))
+    return regressions
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'opencv_threads': cv2.getNumThreads(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the occupancy pipeline")
+    parser.add_argument("--repeat", type=int, default=50, help="Runs per case")
+    parser.add_argument("--clip", default=None, help="Recorded clip for the end-to-end case")
+    parser.add_argument("--out", default=RESULTS_PATH, help="Results file")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed slowdown, 0.10 = 10%%")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="OpenCV threads; pinned so runs are comparable")
+    args = parser.parse_args()
+
+    cv2.setNumThreads(args.threads)
+    results = {}
+    bench_matching(results, args.repeat)
+    bench_render(results, args.repeat)
+
+    if args.clip:
+        bench_end_to_end(results, args.clip)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            clip = os.path.join(tmp, "synthetic.mp4")
+            synthetic_clip(clip)
+            bench_end_to_end(results, clip)
+
+    report = {'environment': environment(), 'results': results}
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.out}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        # Nothing compared is not a pass
+        print(f"No baseline at {args.baseline}; run with --save-baseline first", file=sys.stderr)
+        return 2
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+
+    regressions = compare(results, baseline, args.tolerance)
+    for case, before, after, ratio in regressions:
+        print(f"REGRESSION {case}: {before:.3f} ms -> {after:.3f} ms (x{ratio:.2f})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""Reusable, reference-counted frame buffers.
+
+The video loop resizes into a pooled slot, draws on it in place and publishes
+it; the stream thread takes a reference to encode it. A slot returns to the
+pool once every holder released it, so in steady state no frame-sized arrays
+are allocated.
+"""
+
+import threading
+
+import numpy as np
+
+
+class FrameSlot:
+    """A pooled frame buffer with a reference count."""
+
+    def __init__(self, pool, array):
+        self.pool = pool
+        self.array = array
+        self.refs = 0
+
+    def retain(self):
+        self.pool._retain(self)
+        return self
+
+    def release(self):
+        self.pool._release(self)
+
+
+class FramePool:
+    """Pool of frame buffers of one shape.
+
+    `acquire` hands out a free slot with one reference; when every slot is in
+    use a new one is allocated and counted in `misses`.
+    """
+
+    def __init__(self, shape, dtype=np.uint8, size=4):
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.lock = threading.Lock()
+        self.free = [FrameSlot(self, np.empty(self.shape, dtype)) for _ in range(size)]
+        self.size = size
+        self.misses = 0
+
+    def acquire(self):
+        with self.lock:
+            if self.free:
+                slot = self.free.pop()
+            else:
+                slot = FrameSlot(self, np.empty(self.shape, self.dtype))
+                self.size += 1
+                self.misses += 1
+            slot.refs = 1
+        return slot
+
+    def _retain(self, slot):
+        with self.lock:
+            slot.refs += 1
+
+    def _release(self, slot):
+        with self.lock:
+            slot.refs -= 1
+            if slot.refs == 0:
+                self.free.append(slot)
+
+
+class LatestFrame:
+    """The most recently published slot and what belongs to it, shared between threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latest = (None, None)
+
+    def publish(self, slot, info=None):
+        """Make `slot` the latest frame, with `info` about it; it keeps its own reference to it."""
+        slot.retain()
+        with self.lock:
+            (previous, _), self.latest = self.latest, (slot, info)
+        if previous is not None:
+            previous.release()
+
+    def take(self):
+        """Return (slot, info) of the latest frame, with a reference to the slot the caller
+        must release, or (None, None)."""
+        with self.lock:
+            slot, info = self.latest
+            if slot is not None:
+                slot.retain()
+        return slot, info
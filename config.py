@@ -0,0 +1,154 @@
+"""Per-camera configuration.
+
+Settings live in `config/<camera>.json` and only need to list the values that
+differ from DEFAULTS.
+"""
+
+import json
+import os
+
+from occupancy import OCCUPANCY_MODES
+
+CONFIG_DIR = "config"
+
+DEFAULTS = {
+    'model_path': "Models/yolov8m mAp 48/weights/best.pt",
+    'frame_width': 960,
+    'frame_height': 540,
+    'jpeg_quality': 70,
+    # Model input size, None for the size the checkpoint was trained at, and an
+    # optional export format ("onnx", "openvino", ...)
+    'imgsz': None,
+    'model_format': "",
+    # Torch intra-op threads for inference; 0 keeps torch's default
+    'torch_threads': 0,
+    # Time every Nth frame for /metrics; 0 disables stage timing
+    'metrics_sample_every': 1,
+    # "center" or "overlap" occupancy test, and the default overlap fraction
+    'occupancy_mode': "center",
+    'overlap_threshold': 0.4,
+    # Learn a layout proposal from the detections while running
+    'auto_layout': False,
+}
+
+
+def _integer(low, high=None):
+    def check(value):
+        if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+            raise ValueError(f"expected an integer, got {value!r}")
+        value = int(value)
+        if value < low:
+            raise ValueError(f"{value} is below {low}")
+        if high is not None and value > high:
+            raise ValueError(f"{value} is above {high}")
+        return value
+    return check
+
+
+def _optional(check):
+    return lambda value: None if value is None else check(value)
+
+
+def _fraction(value):
+    value = float(value)
+    if not 0 <= value <= 1:
+        raise ValueError(f"{value} is outside 0..1")
+    return value
+
+
+def _string(value):
+    if not isinstance(value, str):
+        raise ValueError(f"expected a string, got {value!r}")
+    return value
+
+
+def _occupancy_mode(value):
+    if value not in OCCUPANCY_MODES:
+        raise ValueError(f"{value!r} is not one of {', '.join(OCCUPANCY_MODES)}")
+    return value
+
+
+def _boolean(value):
+    if not isinstance(value, bool):
+        raise ValueError(f"expected true or false, got {value!r}")
+    return value
+
+
+# Coerces a value of each setting, raising ValueError when it is not acceptable
+CHECKS = {
+    'model_path': _string,
+    'frame_width': _integer(16, 7680),
+    'frame_height': _integer(16, 4320),
+    'jpeg_quality': _integer(1, 100),
+    'imgsz': _optional(_integer(32, 4096)),
+    'model_format': _string,
+    'torch_threads': _integer(0, 1024),
+    'metrics_sample_every': _integer(0),
+    'occupancy_mode': _occupancy_mode,
+    'overlap_threshold': _fraction,
+    'auto_layout': _boolean,
+}
+
+
+def validate_config(config):
+    """Return `config` with every known setting coerced; raises ValueError naming the bad ones."""
+    checked = dict(config)
+    errors = []
+    for key, check in CHECKS.items():
+        if key in checked:
+            try:
+                checked[key] = check(checked[key])
+            except (TypeError, ValueError) as e:
+                errors.append(f"{key}: {e}")
+    if errors:
+        raise ValueError("invalid settings: " + "; ".join(errors))
+    return checked
+
+
+def config_path(camera):
+    """Return the configuration file of a camera."""
+    return os.path.join(CONFIG_DIR, f"{camera}.json")
+
+
+def load_config(camera, strict=False):
+    """Return the configuration of a camera merged over the defaults.
+
+    A bad file or value falls back to the defaults with a message, or with
+    `strict` raises ValueError so the caller can keep its current settings.
+    """
+    config = dict(DEFAULTS)
+    path = config_path(camera)
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                config.update(json.load(f))
+        except (OSError, ValueError) as e:
+            if strict:
+                raise ValueError(f"Could not load config {path}: {e}")
+            print(f"Could not load config {path}: {e}")
+    if strict:
+        return validate_config(config)
+    for key, check in CHECKS.items():
+        try:
+            config[key] = check(config[key])
+        except (TypeError, ValueError) as e:
+            print(f"Ignoring {key} in {path}: {e}")
+            config[key] = DEFAULTS[key]
+    return config
+
+
+def save_config(camera, updates):
+    """Merge `updates` into the configuration file of a camera, atomically."""
+    path = config_path(camera)
+    config = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            config = json.load(f)
+    config.update(updates)
+
+    os.makedirs(CONFIG_DIR, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, path)
+    return config
@@ -0,0 +1,295 @@
+"""Hot reloading of layouts, models and settings.
+
+A RuntimeControl watches the camera layout and config files and listens for
+HTTP commands. Changes are prepared on its own threads (layouts compiled,
+models loaded and warmed up) and handed over through `take_pending`: models
+and settings to the video loop at the next frame boundary, layouts to the
+editor, which publishes them to the video loop. Changes to the layout made
+over HTTP are applied by the editor too, to the layout as it edited it, and
+saved by it, so neither overwrites the other's edits.
+
+    curl -X POST localhost:9998/reload
+    curl -X POST localhost:9998/config -d '{"model_path": "Models/Yolov8s mAp 45/weights/best.pt"}'
+    curl -X POST localhost:9998/layout/spaces -d '{"spaces": [0, 1], "set": {"threshold": 0.6}}'
+    curl -X POST localhost:9998/auto-layout -d '{"enabled": true}'
+    curl localhost:9998/auto-layout
+    curl -X POST localhost:9998/auto-layout/accept
+"""
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from auto_layout import AutoLayoutBuilder
+from config import config_path, load_config, validate_config
+from inference import load_model
+from layout_store import get_writer, layout_path, load_camera_layout, space_attributes
+from occupancy import compile_layout, valid_threshold
+
+CONTROL_HOST = '127.0.0.1'
+CONTROL_PORT = 9998
+WATCH_INTERVAL = 1.0
+# A camera is ready while it produced a frame this recently
+READY_TIMEOUT = 2.0
+# The editor applies layout changes within one redraw; this long means it is not running
+LAYOUT_CHANGE_TIMEOUT = 5.0
+MODEL_KEYS = ('model_path', 'model_format', 'imgsz', 'frame_width', 'frame_height')
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class LayoutChange:
+    """A change to the edited layout, applied by the editor on its own thread.
+
+    `change(polygon_data, meta)` returns the new polygons and metadata.
+    """
+
+    def __init__(self, change):
+        self.change = change
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def apply(self, polygon_data, meta):
+        """Return (polygon_data, meta, compiled layout) after the change, or None when it failed."""
+        try:
+            polygon_data, meta = self.change(polygon_data, meta)
+            # Compiling rejects bad values before anything is saved
+            self.result = (polygon_data, meta, compile_layout(polygon_data, meta))
+        except Exception as e:
+            self.error = e
+        self.done.set()
+        return self.result
+
+
+class RuntimeControl:
+    """Prepares layout, model and setting changes off the video thread."""
+
+    def __init__(self, camera, config):
+        self.camera = camera
+        self.config = dict(config)
+        self.lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+        self.pending = {}
+        self.layout_mtime = _mtime(layout_path(camera))
+        self.config_mtime = _mtime(config_path(camera))
+        self.last_frame = None
+        # Fed by the video loop with the detections it already computed
+        self.auto_layout = AutoLayoutBuilder()
+        self.auto_layout.enabled = bool(config.get('auto_layout'))
+
+    def start(self, host=CONTROL_HOST, port=CONTROL_PORT):
+        """Start the file watcher and the HTTP command server."""
+        threading.Thread(target=self._watch, daemon=True).start()
+
+        control = self
+
+        class Handler(ControlRequestHandler):
+            runtime = control
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Control server started at {host}:{port}")
+
+    def mark_frame(self):
+        """Record that the video loop produced a frame."""
+        self.last_frame = time.monotonic()
+
+    def is_ready(self):
+        """Return True while frames are being produced."""
+        return self.last_frame is not None and time.monotonic() - self.last_frame < READY_TIMEOUT
+
+    def take_pending(self, keys=None):
+        """Return and clear the prepared changes, or only those of `keys`; called at frame boundaries."""
+        with self.lock:
+            if keys is None:
+                pending, self.pending = self.pending, {}
+            else:
+                pending = {key: self.pending.pop(key) for key in keys if key in self.pending}
+        return pending
+
+    def _post(self, key, value):
+        with self.lock:
+            self.pending[key] = value
+
+    def reload_layout(self):
+        """Load and compile the camera layout from disk."""
+        with self.reload_lock:
+            polygon_data, meta = load_camera_layout(self.camera)
+            self._post('layout', (polygon_data, compile_layout(polygon_data, meta)))
+            print(f"Layout reloaded: {len(polygon_data)} parking spaces")
+            return len(polygon_data)
+
+    def apply_config(self, updates):
+        """Apply configuration changes, loading a new model first if needed."""
+        with self.reload_lock:
+            config = dict(self.config)
+            config.update(updates)
+            # Reject bad values here, before the video loop ever sees them
+            config = validate_config(config)
+            changed = {k: v for k, v in config.items() if self.config.get(k) != v}
+            if not changed:
+                return changed
+
+            if any(key in changed for key in MODEL_KEYS):
+                # Load and warm the new model here so the swap itself is instant
+                model = load_model(config['model_path'], (config['frame_width'], config['frame_height']),
+                                   config['imgsz'], config['model_format'])
+                self._post('model', model)
+            self._post('settings', config)
+            self.config = config
+            print(f"Configuration updated: {', '.join(sorted(changed))}")
+            return changed
+
+    def change_layout(self, change):
+        """Have the editor apply `change(polygon_data, meta)` to its layout and save it.
+
+        Returns the new (polygon_data, meta, compiled layout) once it is applied.
+        """
+        request = LayoutChange(change)
+        self._post('layout_change', request)
+        if not request.done.wait(LAYOUT_CHANGE_TIMEOUT):
+            with self.lock:
+                withdrawn = self.pending.get('layout_change') is request
+                if withdrawn:
+                    del self.pending['layout_change']
+            if withdrawn:
+                raise TimeoutError("the layout editor did not take the change")
+            request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def update_spaces(self, indices, attributes):
+        """Set attributes of some spaces (None removes one), save and swap in the layout."""
+        threshold = attributes.get('threshold')
+        if threshold is not None and not valid_threshold(threshold):
+            raise ValueError(f"threshold must be a number in (0, 1], got {threshold!r}")
+
+        def change(polygon_data, meta):
+            spaces = space_attributes(meta, len(polygon_data))
+            for i in indices:
+                if not 0 <= i < len(spaces):
+                    raise ValueError(f"no space {i}, the layout has {len(spaces)}")
+                for key, value in attributes.items():
+                    if value is None:
+                        spaces[i].pop(key, None)
+                    else:
+                        spaces[i][key] = value
+            return polygon_data, dict(meta, spaces=spaces)
+
+        with self.reload_lock:
+            self.change_layout(change)
+            return len(indices)
+
+    def accept_auto_layout(self):
+        """Save the proposed auto layout and swap it in."""
+        with self.reload_lock:
+            polygon_data = self.auto_layout.proposal()
+            if not polygon_data:
+                raise ValueError("no spaces proposed yet")
+            self.change_layout(lambda *layout: (polygon_data, {}))
+            print(f"Auto layout accepted: {len(polygon_data)} parking spaces")
+            return len(polygon_data)
+
+    def reload_config(self):
+        """Apply the camera config file; a bad file keeps the current settings."""
+        return self.apply_config(load_config(self.camera, strict=True))
+
+    def _watch(self):
+        while True:
+            time.sleep(WATCH_INTERVAL)
+            try:
+                writer = get_writer(self.camera)
+                # Under the write lock, a file our writer is replacing is seen with its mtime recorded
+                with writer.write_lock:
+                    mtime = _mtime(layout_path(self.camera))
+                    own = mtime == writer.written_mtime
+                if mtime != self.layout_mtime:
+                    self.layout_mtime = mtime
+                    # Skip the files our own editor just saved
+                    if mtime is not None and not own:
+                        self.reload_layout()
+
+                mtime = _mtime(config_path(self.camera))
+                if mtime != self.config_mtime:
+                    self.config_mtime = mtime
+                    self.reload_config()
+            except Exception as e:
+                print(f"Reload failed: {e}")
+
+
+class ControlRequestHandler(BaseHTTPRequestHandler):
+    """HTTP commands of a RuntimeControl."""
+
+    runtime = None
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(body, dict):
+            raise ValueError("expected a JSON object")
+        return body
+
+    def do_GET(self):
+        if self.path == "/status":
+            self._reply(200, {'camera': self.runtime.camera, 'config': self.runtime.config})
+        elif self.path == "/ready":
+            ready = self.runtime.is_ready()
+            self._reply(200 if ready else 503, {'ready': ready})
+        elif self.path == "/auto-layout":
+            self._reply(200, self.runtime.auto_layout.status())
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        try:
+            if self.path == "/reload":
+                spaces = self.runtime.reload_layout()
+                changed = self.runtime.reload_config()
+                self._reply(200, {'spaces': spaces, 'changed': sorted(changed)})
+            elif self.path == "/reload/layout":
+                self._reply(200, {'spaces': self.runtime.reload_layout()})
+            elif self.path == "/config":
+                changed = self.runtime.apply_config(self._read_json())
+                self._reply(200, {'changed': sorted(changed)})
+            elif self.path == "/layout/spaces":
+                body = self._read_json()
+                indices = [int(i) for i in body.get('spaces', [])]
+                attributes = body.get('set', {})
+                if not isinstance(attributes, dict):
+                    raise ValueError("'set' must be a JSON object")
+                self._reply(200, {'updated': self.runtime.update_spaces(indices, attributes)})
+            elif self.path == "/auto-layout":
+                body = self._read_json()
+                builder = self.runtime.auto_layout
+                if body.get('reset'):
+                    builder.reset()
+                if 'enabled' in body:
+                    builder.enabled = bool(body['enabled'])
+                self._reply(200, builder.status())
+            elif self.path == "/auto-layout/accept":
+                self._reply(200, {'spaces': self.runtime.accept_auto_layout()})
+            else:
+                self._reply(404, {'error': 'not found'})
+        except Exception as e:
+            self._reply(400, {'error': str(e)})
+
+    def log_message(self, format, *args):
+        pass
@@ -1,4 +1,4 @@
-import pickle
+from layout_store import DEFAULT_CAMERA, get_writer, load_camera_layout
 from shapely.geometry import Polygon
 
 
@@ -11,22 +11,15 @@ def find_polygon_center(points):
     return (center_x, center_y)
 
 
-def save_object(poligon):
-    """Save the polygon object to a file."""
-    with open("object/poligon.obj", "wb") as f:
-        pickle.dump(poligon, f)
+def save_object(poligon, camera=DEFAULT_CAMERA, meta=None):
+    """Queue the polygon object and its metadata to be saved in the background."""
+    get_writer(camera).save(poligon, meta)
 
 
-def load_object():
-    """Load the polygon object from a file."""
-    try:
-        with open("object/poligon.obj", "rb") as f:
-            return pickle.load(f)
-    except:
-        save_object([])
-
-        with open("object/poligon.obj", "rb") as f:
-            return pickle.load(f)
+def load_object(camera=DEFAULT_CAMERA):
+    """Load the polygon object of a camera."""
+    polygon_data, meta = load_camera_layout(camera)
+    return polygon_data
 
 
 def IoU(polygon_1, polygon_2):
@@ -0,0 +1,97 @@
+"""Occupancy counts per group of spaces.
+
+Spaces join groups through the "groups" attribute of the layout, a list of
+slash-separated paths such as "P2/row B" or "type/ev". A path makes the space
+a member of every level of it: "P2/row B" counts towards "P2" and "P2/row B".
+Counters are updated from the spaces whose state changed, so a frame costs
+O(changes) no matter how large the layout is.
+"""
+
+import numpy as np
+
+
+def space_stats(total, occupied):
+    """Return the counts of a set of spaces in the /stats format."""
+    return {
+        'total_spaces': total,
+        'free_spaces': total - occupied,
+        'occupied_spaces': occupied,
+        'occupancy_rate': round(occupied / total * 100, 1) if total > 0 else 0,
+    }
+
+
+def expand_groups(paths):
+    """Return every level of the given group paths, without duplicates."""
+    if isinstance(paths, str):
+        paths = [paths]
+    names = []
+    for path in paths:
+        parts = [part.strip() for part in str(path).split("/") if part.strip()]
+        for depth in range(1, len(parts) + 1):
+            name = "/".join(parts[:depth])
+            if name not in names:
+                names.append(name)
+    return names
+
+
+class GroupCounters:
+    """Total and occupied counts of a layout and of each of its groups."""
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.names = []
+        self.index = {}
+        members = []
+        for attributes in layout.spaces:
+            ids = []
+            for name in expand_groups(attributes.get('groups', [])):
+                if name not in self.index:
+                    self.index[name] = len(self.names)
+                    self.names.append(name)
+                ids.append(self.index[name])
+            members.append(ids)
+
+        # Group ids of space i are group_ids[indptr[i]:indptr[i + 1]]
+        self.indptr = np.zeros(layout.size + 1, dtype=np.int64)
+        np.cumsum([len(ids) for ids in members], out=self.indptr[1:])
+        self.group_ids = np.array([g for ids in members for g in ids], dtype=np.int64)
+        self.totals = np.bincount(self.group_ids, minlength=len(self.names)).astype(np.int64)
+        self.occupied = np.zeros(len(self.names), dtype=np.int64)
+        self.state = np.zeros(layout.size, dtype=bool)
+        self.occupied_total = 0
+        # Increases whenever a count changes
+        self.version = 0
+
+    def update(self, occupied):
+        """Apply the per-space states of a frame; returns the number of changed spaces."""
+        changed = np.flatnonzero(occupied != self.state)
+        if len(changed) == 0:
+            return 0
+        self.state[changed] = occupied[changed]
+        delta = np.where(occupied[changed], 1, -1)
+        self.occupied_total += int(delta.sum())
+
+        # Gather the group ids of the changed spaces without a Python loop
+        starts = self.indptr[changed]
+        lengths = self.indptr[changed + 1] - starts
+        if lengths.sum():
+            positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            np.add.at(self.occupied, self.group_ids[positions], np.repeat(delta, lengths))
+        self.version += 1
+        return len(changed)
+
+    def lot(self):
+        """Return the counts of the whole layout."""
+        return space_stats(self.layout.size, self.occupied_total)
+
+    def group(self, name):
+        """Return the counts of one group, or None if no space belongs to it."""
+        i = self.index.get(name)
+        if i is None:
+            return None
+        return space_stats(int(self.totals[i]), int(self.occupied[i]))
+
+    def snapshot(self):
+        """Return {group: [total, occupied]} of every group."""
+        return {name: [int(total), int(occupied)]
+                for name, total, occupied in zip(self.names, self.totals, self.occupied)}
@@ -0,0 +1,266 @@
+"""Append-only occupancy history store.
+
+Two kinds of fixed-width records are kept:
+
+- transitions: one record each time a space changes between free and occupied
+- aggregates: one record per interval with min/max/mean occupied spaces
+
+Records are appended to segment files under the history directory and read
+back through memory maps, while the most recent records also stay in a
+bounded in-memory ring so live dashboards never touch the disk.
+"""
+
+import glob
+import os
+import threading
+import time
+
+import numpy as np
+
+TRANSITION_DTYPE = np.dtype([
+    ('ts', '<f8'),
+    ('space', '<u4'),
+    ('state', 'u1'),
+])
+
+AGGREGATE_DTYPE = np.dtype([
+    ('ts', '<f8'),         # interval start
+    ('samples', '<u4'),    # frames seen during the interval
+    ('total', '<u4'),      # spaces in the layout at the end of the interval
+    ('min', '<u4'),        # fewest occupied spaces
+    ('max', '<u4'),        # most occupied spaces
+    ('sum', '<f8'),        # sum of occupied spaces over all samples
+])
+
+
+class RecordRing:
+    """Bounded ring of the most recent fixed-width records."""
+
+    def __init__(self, dtype, capacity):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.count = 0
+        self.head = 0
+
+    def append(self, records):
+        records = records[-self.capacity:]
+        n = len(records)
+        end = self.head + n
+        if end <= self.capacity:
+            self.data[self.head:end] = records
+        else:
+            split = self.capacity - self.head
+            self.data[self.head:] = records[:split]
+            self.data[:n - split] = records[split:]
+        self.head = end % self.capacity
+        self.count = min(self.count + n, self.capacity)
+
+    def records(self):
+        """Return the stored records, oldest first."""
+        if self.count < self.capacity:
+            return self.data[:self.count]
+        return np.concatenate((self.data[self.head:], self.data[:self.head]))
+
+    def oldest(self):
+        """Return the timestamp of the oldest record, or None when empty."""
+        if self.count == 0:
+            return None
+        return float(self.data['ts'][self.head if self.count == self.capacity else 0])
+
+
+class SegmentLog:
+    """Append-only log of fixed-width records split into segment files."""
+
+    def __init__(self, root, kind, dtype, segment_records):
+        self.root = root
+        self.kind = kind
+        self.dtype = dtype
+        self.segment_records = segment_records
+        os.makedirs(root, exist_ok=True)
+
+    def segments(self):
+        """Return (first_ts, path) of every segment, oldest first."""
+        paths = sorted(glob.glob(os.path.join(self.root, f"{self.kind}-*.bin")))
+        return [(int(os.path.basename(p)[len(self.kind) + 1:-4]) / 1000, p) for p in paths]
+
+    def append(self, records):
+        if len(records) == 0:
+            return
+        segments = self.segments()
+        if segments and os.path.getsize(segments[-1][1]) < self.segment_records * self.dtype.itemsize:
+            path = segments[-1][1]
+        else:
+            path = os.path.join(self.root, f"{self.kind}-{int(records['ts'][0] * 1000):015d}.bin")
+        with open(path, "ab") as f:
+            f.write(records.tobytes())
+
+    def read(self, start, end):
+        """Return the records with start <= ts < end."""
+        segments = self.segments()
+        parts = []
+        for i, (first_ts, path) in enumerate(segments):
+            next_ts = segments[i + 1][0] if i + 1 < len(segments) else float('inf')
+            if next_ts <= start or first_ts >= end:
+                continue
+            # Ignore a partially written trailing record
+            count = os.path.getsize(path) // self.dtype.itemsize
+            if count == 0:
+                continue
+            records = np.memmap(path, dtype=self.dtype, mode='r', shape=(count,))
+            lo, hi = np.searchsorted(records['ts'], [start, end])
+            parts.append(np.array(records[lo:hi]))
+        if not parts:
+            return np.zeros(0, dtype=self.dtype)
+        return np.concatenate(parts)
+
+
+class HistoryStore:
+    """Occupancy history with downsampled queries."""
+
+    def __init__(self, root="history", interval=60, ring_size=10080,
+                 segment_records=100000, flush_seconds=10):
+        self.interval = interval
+        self.flush_seconds = flush_seconds
+        self.transition_log = SegmentLog(root, "transitions", TRANSITION_DTYPE, segment_records)
+        self.aggregate_log = SegmentLog(root, "aggregates", AGGREGATE_DTYPE, segment_records)
+        self.transition_ring = RecordRing(TRANSITION_DTYPE, ring_size * 10)
+        self.aggregate_ring = RecordRing(AGGREGATE_DTYPE, ring_size)
+        self.lock = threading.Lock()
+
+        self.previous = None
+        self.current = None
+        self.pending_transitions = []
+        self.pending_aggregates = []
+        self.last_flush = time.time()
+
+    def record(self, ts, occupied_count, total_spaces, states=None):
+        """Add one frame worth of occupancy.
+
+        `states` is an optional boolean array with the state of every space,
+        used to log per-space transitions.
+        """
+        with self.lock:
+            if states is not None:
+                self._record_transitions(ts, states)
+            self._record_aggregate(ts, occupied_count, total_spaces)
+            if ts - self.last_flush >= self.flush_seconds:
+                self._flush(ts)
+
+    def _record_transitions(self, ts, states):
+        states = np.asarray(states, dtype=bool)
+        if self.previous is None or len(self.previous) != len(states):
+            # First frame or a new layout: log the state of every space
+            changed = np.arange(len(states))
+        else:
+            changed = np.flatnonzero(states != self.previous)
+        self.previous = states.copy()
+        if len(changed) == 0:
+            return
+
+        records = np.zeros(len(changed), dtype=TRANSITION_DTYPE)
+        records['ts'] = ts
+        records['space'] = changed
+        records['state'] = states[changed]
+        self.transition_ring.append(records)
+        self.pending_transitions.append(records)
+
+    def _record_aggregate(self, ts, occupied_count, total_spaces):
+        bucket = ts - ts % self.interval
+        current = self.current
+        if current is not None and current['ts'] != bucket:
+            self._close_aggregate()
+            current = None
+        if current is None:
+            current = self.current = np.zeros((), dtype=AGGREGATE_DTYPE)
+            current['ts'] = bucket
+            current['min'] = occupied_count
+        current['samples'] += 1
+        current['total'] = total_spaces
+        current['min'] = min(int(current['min']), occupied_count)
+        current['max'] = max(int(current['max']), occupied_count)
+        current['sum'] += occupied_count
+
+    def _close_aggregate(self):
+        records = self.current.reshape(1).copy()
+        self.aggregate_ring.append(records)
+        self.pending_aggregates.append(records)
+        self.current = None
+
+    def _flush(self, ts):
+        if self.pending_transitions:
+            self.transition_log.append(np.concatenate(self.pending_transitions))
+        if self.pending_aggregates:
+            self.aggregate_log.append(np.concatenate(self.pending_aggregates))
+        self.pending_transitions = []
+        self.pending_aggregates = []
+        self.last_flush = ts
+
+    def flush(self):
+        """Write every pending record to disk."""
+        with self.lock:
+            self._flush(time.time())
+
+    def _select(self, ring, log, pending, start, end):
+        oldest = ring.oldest()
+        if oldest is not None and oldest <= start:
+            records = ring.records()
+        else:
+            parts = [log.read(start, end)] + pending
+            records = np.concatenate(parts)
+        ts = records['ts']
+        return records[(ts >= start) & (ts < end)]
+
+    def aggregates(self, start, end, buckets):
+        """Downsample interval aggregates in [start, end) into `buckets` buckets.
+
+        Returns columns with the bucket start time, samples and the min, max
+        and mean number of occupied spaces; empty buckets hold None.
+        """
+        with self.lock:
+            records = self._select(self.aggregate_ring, self.aggregate_log,
+                                   self.pending_aggregates, start, end)
+            if self.current is not None and start <= self.current['ts'] < end:
+                records = np.concatenate((records, self.current.reshape(1)))
+
+        edges = np.linspace(start, end, buckets + 1)
+        bounds = np.searchsorted(records['ts'], edges)
+        counts = np.diff(bounds)
+        filled = counts > 0
+        starts = bounds[:-1][filled]
+
+        columns = {
+            't': edges[:-1].round(3).tolist(),
+            'samples': [0] * buckets,
+            'min': [None] * buckets,
+            'max': [None] * buckets,
+            'mean': [None] * buckets,
+            'total': [None] * buckets,
+        }
+        if len(starts):
+            samples = np.add.reduceat(records['samples'].astype(np.int64), starts)
+            sums = np.add.reduceat(records['sum'], starts)
+            columns_filled = {
+                'samples': samples.tolist(),
+                'min': np.minimum.reduceat(records['min'], starts).tolist(),
+                'max': np.maximum.reduceat(records['max'], starts).tolist(),
+                'mean': np.round(sums / np.maximum(samples, 1), 2).tolist(),
+                'total': records['total'][bounds[1:][filled] - 1].tolist(),
+            }
+            for index, bucket in enumerate(np.flatnonzero(filled)):
+                for name, values in columns_filled.items():
+                    columns[name][bucket] = values[index]
+        return columns
+
+    def transitions(self, start, end, space=None, limit=1000):
+        """Return the state transitions in [start, end), optionally for one space."""
+        with self.lock:
+            records = self._select(self.transition_ring, self.transition_log,
+                                   self.pending_transitions, start, end)
+        if space is not None:
+            records = records[records['space'] == space]
+        records = records[-limit:]
+        return {
+            't': records['ts'].round(3).tolist(),
+            'space': records['space'].tolist(),
+            'occupied': records['state'].astype(bool).tolist(),
+        }
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from preprocess import STRIDE, Letterbox
+
+# Exported/optimized models, keyed by weights file, format and input size
+EXPORT_CACHE_DIR = "Models/.cache"
+# File in each cache entry naming the exported artifact and its input size
+EXPORT_MARKER = "export.json"
+WARMUP_RUNS = 2
+# Ultralytics' own default, for models that do not record their training size
+DEFAULT_IMGSZ = 640
+
+_preload_thread = None
+_predictor_class = None
+
+
+def _import_backend():
+    import ultralytics  # noqa: F401  (pulls in torch, the slow part of startup)
+
+
+def preload():
+    """Start importing ultralytics/torch in the background."""
+    global _preload_thread
+    if _preload_thread is None:
+        _preload_thread = threading.Thread(target=_import_backend, daemon=True)
+        _preload_thread.start()
+
+
+def set_threads(threads):
+    """Limit torch to `threads` intra-op threads; 0 keeps its default."""
+    if threads > 0:
+        import torch
+        torch.set_num_threads(threads)
+
+
+def cached_export(model_path, model_format, imgsz=None):
+    """Return (path, imgsz) of `model_path` exported to `model_format`, exporting it once.
+
+    Exports are stored under EXPORT_CACHE_DIR and reused for as long as the
+    weights file is unchanged. Without `imgsz` the export is made at the size
+    the checkpoint was trained at; the entry records that size, so a cache
+    hit does not load the weights to find it.
+    """
+    if imgsz is not None:
+        imgsz = model_imgsz(None, imgsz)
+    stat = os.stat(model_path)
+    key = f"{os.path.abspath(model_path)}|{stat.st_size}|{stat.st_mtime_ns}|{model_format}|{imgsz or 'trained'}"
+    cache_dir = os.path.join(EXPORT_CACHE_DIR, hashlib.sha1(key.encode("utf-8")).hexdigest()[:16])
+
+    try:
+        with open(os.path.join(cache_dir, EXPORT_MARKER)) as f:
+            entry = json.load(f)
+        return os.path.join(cache_dir, entry['artifact']), entry['imgsz']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    from ultralytics import YOLO
+
+    model = YOLO(model_path)
+    imgsz = model_imgsz(model, imgsz)
+    print(f"Exporting {model_path} to {model_format} at {imgsz}px (cached for later starts)")
+    exported = str(model.export(format=model_format, imgsz=imgsz))
+    # The entry is assembled with its marker in a temporary directory and
+    # renamed into place, so an interrupted export never looks cached
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=EXPORT_CACHE_DIR)
+    name = os.path.basename(exported.rstrip(os.sep))
+    shutil.move(exported, os.path.join(staging, name))
+    with open(os.path.join(staging, EXPORT_MARKER), "w") as f:
+        json.dump({'artifact': name, 'imgsz': imgsz}, f)
+    shutil.rmtree(cache_dir, ignore_errors=True)  # Left without a marker by an older version
+    os.replace(staging, cache_dir)
+    return os.path.join(cache_dir, name), imgsz
+
+
+def model_imgsz(model, imgsz=None):
+    """Return the input size to run `model` at: `imgsz`, or by default the size
+    the checkpoint was trained at, rounded up to a multiple of the stride."""
+    if imgsz is None:
+        imgsz = model.overrides.get('imgsz') or DEFAULT_IMGSZ
+    if isinstance(imgsz, (list, tuple)):
+        imgsz = max(imgsz)
+    return -(-int(imgsz) // STRIDE) * STRIDE
+
+
+def load_model(model_path, frame_size, imgsz=None, model_format=""):
+    """Load a YOLO model and run warm-up inferences at the frame and input size.
+
+    Without `imgsz` the model runs at the size it was trained at. With a
+    `model_format` such as "onnx" or "openvino" the weights are exported once
+    and the cached export is loaded instead.
+    """
+    from ultralytics import YOLO
+
+    if model_format:
+        path, imgsz = cached_export(model_path, model_format, imgsz)
+        model = YOLO(path, task='detect')
+        # Exports do not record the size; model_imgsz finds it here
+        model.overrides['imgsz'] = imgsz
+    else:
+        model = YOLO(model_path)
+    imgsz = model_imgsz(model, imgsz)
+
+    width, height = frame_size
+    blank = np.zeros((height, width, 3), dtype=np.uint8)
+    letterbox = letterbox_for(frame_size, imgsz, model_format)
+    # The first inferences pay for lazy initialization and buffer allocation
+    for _ in range(WARMUP_RUNS):
+        detect(model, letterbox, blank)
+    return model
+
+
+def letterbox_for(frame_size, imgsz, model_format=""):
+    """Return the Letterbox of a model: exported models take a fixed square input."""
+    return Letterbox(frame_size, imgsz, rect=not model_format)
+
+
+def _tensor_predictor():
+    """Return a DetectionPredictor for letterboxed tensor input, created once.
+
+    For tensor input Ultralytics converts the whole batch back to a uint8 BGR
+    image, only to attach it to the results. This one passes a view of the
+    input instead, which detect() drops; it maps the boxes to the frame itself.
+    """
+    global _predictor_class
+    if _predictor_class is None:
+        from ultralytics.models.yolo.detect import DetectionPredictor
+
+        class TensorPredictor(DetectionPredictor):
+            def postprocess(self, preds, img, orig_imgs, **kwargs):
+                return super().postprocess(preds, img, [im.permute(1, 2, 0).numpy() for im in img.cpu()], **kwargs)
+
+        _predictor_class = TensorPredictor
+    return _predictor_class
+
+
+def detect(model, letterbox, frame):
+    """Run `model` on `frame` through `letterbox`; the result's boxes are in frame coordinates.
+
+    The letterboxed input is handed to the model as a tensor sharing the
+    buffer's memory, so Ultralytics skips its own preprocessing, and
+    converts nothing back after it. The result carries no image: its
+    `orig_img` would be that buffer, which the next call overwrites.
+    """
+    import torch
+
+    results = model(torch.from_numpy(letterbox.fill(frame)), device='cpu', verbose=False,
+                    predictor=_tensor_predictor())[0]
+    data = results.boxes.data.cpu().numpy().copy()
+    letterbox.to_frame(data[:, :4])
+    results.boxes.data = torch.from_numpy(data)
+    results.boxes.orig_shape = results.orig_shape = frame.shape[:2]
+    results.orig_img = None
+    return results
@@ -0,0 +1,255 @@
+"""Versioned binary storage of parking layouts.
+
+Each camera has its own layout file, `object/<camera>.layout`:
+
+    header   magic b"PKLY", version, flags, spaces, points, metadata size
+    offsets  uint32[spaces + 1], first point of every space
+    points   int32[points, 2], x/y of every polygon point
+    metadata UTF-8 JSON object; its optional "spaces" list holds one
+             attribute object per space, e.g. {"threshold": 0.5}
+
+Files are loaded through a memory map and written by a background thread that
+debounces bursts of edits and atomically replaces the previous file, so
+editing a layout never blocks the video loop.
+"""
+
+import atexit
+import json
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+
+import numpy as np
+
+LAYOUT_DIR = "object"
+DEFAULT_CAMERA = "default"
+# Pickled layout used before the binary format, migrated on first load
+LEGACY_LAYOUT_PATH = "object/poligon.obj"
+
+MAGIC = b"PKLY"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIII")
+# A failed write is retried after RETRY_MIN seconds, doubling up to RETRY_MAX
+RETRY_MIN = 1.0
+RETRY_MAX = 30.0
+
+
+def layout_path(camera=DEFAULT_CAMERA):
+    """Return the layout file of a camera."""
+    return os.path.join(LAYOUT_DIR, f"{camera}.layout")
+
+
+def encode_layout(polygon_data, meta=None):
+    """Serialize polygons and metadata to the binary layout format."""
+    counts = np.array([len(p) for p in polygon_data], dtype=np.uint32)
+    offsets = np.zeros(len(polygon_data) + 1, dtype=np.uint32)
+    np.cumsum(counts, out=offsets[1:])
+    points = np.array([pt for p in polygon_data for pt in p], dtype=np.int32).reshape(-1, 2)
+    meta_bytes = json.dumps(meta or {}, separators=(",", ":")).encode("utf-8")
+
+    header = HEADER.pack(MAGIC, VERSION, 0, len(polygon_data), len(points), len(meta_bytes))
+    return b"".join((header, offsets.astype("<u4").tobytes(),
+                     points.astype("<i4").tobytes(), meta_bytes))
+
+
+def read_layout(path):
+    """Memory-map a layout file.
+
+    Returns (offsets, points, meta) where offsets and points are read-only
+    arrays backed by the file.
+    """
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(buffer) < HEADER.size:
+        raise ValueError(f"{path} is not a layout file")
+    magic, version, flags, spaces, point_count, meta_size = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a layout file")
+    if version > VERSION:
+        raise ValueError(f"{path} has layout version {version}, newest supported is {VERSION}")
+    expected = HEADER.size + (spaces + 1) * 4 + point_count * 8 + meta_size
+    if len(buffer) != expected:
+        raise ValueError(f"{path} is truncated or corrupt")
+
+    position = HEADER.size
+    offsets = np.frombuffer(buffer, dtype="<u4", count=spaces + 1, offset=position)
+    if offsets[0] != 0 or offsets[-1] != point_count or np.any(np.diff(offsets.astype(np.int64)) < 0):
+        raise ValueError(f"{path} is truncated or corrupt")
+    position += offsets.nbytes
+    points = np.frombuffer(buffer, dtype="<i4", count=point_count * 2, offset=position).reshape(-1, 2)
+    position += points.nbytes
+    meta = json.loads(buffer[position:position + meta_size].decode("utf-8"))
+    return offsets, points, meta
+
+
+def load_layout(path):
+    """Load a layout file as (polygon_data, meta)."""
+    offsets, points, meta = read_layout(path)
+    coords = points.tolist()
+    bounds = offsets.tolist()
+    polygon_data = [[tuple(pt) for pt in coords[bounds[i]:bounds[i + 1]]]
+                    for i in range(len(bounds) - 1)]
+    return polygon_data, meta
+
+
+def space_attributes(meta, count):
+    """Return the per-space attribute dicts of a layout, one per space."""
+    spaces = [dict(s) if isinstance(s, dict) else {} for s in (meta or {}).get('spaces', [])[:count]]
+    return spaces + [{} for _ in range(count - len(spaces))]
+
+
+def save_layout(path, polygon_data, meta=None):
+    """Write a layout file, atomically replacing the previous one."""
+    data = encode_layout(polygon_data, meta)
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def migrate_legacy_layout(camera=DEFAULT_CAMERA):
+    """Convert the pickled layout to the binary format, once."""
+    path = layout_path(camera)
+    if camera != DEFAULT_CAMERA or os.path.exists(path) or not os.path.exists(LEGACY_LAYOUT_PATH):
+        return
+    with open(LEGACY_LAYOUT_PATH, "rb") as f:
+        polygon_data = pickle.load(f)
+    save_layout(path, polygon_data)
+    print(f"Migrated {len(polygon_data)} parking spaces from {LEGACY_LAYOUT_PATH} to {path}")
+
+
+def load_camera_layout(camera=DEFAULT_CAMERA):
+    """Load the polygons and metadata of a camera.
+
+    A missing layout is empty. A corrupt layout is reported and left on disk
+    untouched instead of being overwritten.
+    """
+    try:
+        migrate_legacy_layout(camera)
+    except Exception as e:
+        print(f"Could not migrate {LEGACY_LAYOUT_PATH}: {e}")
+
+    path = layout_path(camera)
+    if not os.path.exists(path):
+        return [], {}
+    try:
+        return load_layout(path)
+    except (OSError, ValueError) as e:
+        print(f"Could not load layout {path}: {e}")
+        return [], {}
+
+
+class LayoutWriter:
+    """Background writer that saves the latest layout of a camera.
+
+    `save` only stores a snapshot and returns. The thread writes once no new
+    snapshot arrived for `delay` seconds, or at the latest `max_delay`
+    seconds after the first unsaved edit. A snapshot that could not be
+    written is kept and retried with backoff until it is, or a newer one
+    replaces it.
+    """
+
+    def __init__(self, path, delay=0.5, max_delay=2.0):
+        self.path = path
+        self.delay = delay
+        self.max_delay = max_delay
+        self.condition = threading.Condition()
+        self.pending = None
+        self.first_edit = 0
+        self.last_edit = 0
+        self.version = 0
+        self.write_lock = threading.Lock()
+        self.written_version = 0
+        self.written_mtime = None
+        self.retry_delay = RETRY_MIN
+        self.retry_at = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def save(self, polygon_data, meta=None):
+        # Polygons are replaced rather than edited in place, so a shallow copy is a snapshot
+        with self.condition:
+            self.version += 1
+            snapshot = (list(polygon_data), meta, self.version)
+            now = time.monotonic()
+            if self.pending is None:
+                self.first_edit = now
+            self.pending = snapshot
+            self.last_edit = now
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.pending is None:
+                    self.condition.wait()
+                now = time.monotonic()
+                due = max(min(self.last_edit + self.delay, self.first_edit + self.max_delay), self.retry_at)
+                if now < due:
+                    self.condition.wait(due - now)
+                    continue
+                snapshot = self.pending
+                self.pending = None
+            self._write(*snapshot)
+
+    def _write(self, polygon_data, meta, version):
+        """Write a snapshot; returns False when it failed and was kept for a retry."""
+        with self.write_lock:
+            # A flush may already have written a newer snapshot
+            if version <= self.written_version:
+                return True
+            try:
+                save_layout(self.path, polygon_data, meta)
+                self.written_version = version
+                self.written_mtime = os.stat(self.path).st_mtime_ns
+            except Exception as e:
+                with self.condition:
+                    # Unless a newer snapshot arrived meanwhile, which is written instead
+                    if self.pending is None:
+                        self.pending = (polygon_data, meta, version)
+                    self.retry_at = time.monotonic() + self.retry_delay
+                    print(f"Could not save layout {self.path}: {e}; retrying in {self.retry_delay:.0f}s")
+                    self.retry_delay = min(self.retry_delay * 2, RETRY_MAX)
+                    self.condition.notify()
+                return False
+            with self.condition:
+                self.retry_delay = RETRY_MIN
+                self.retry_at = 0
+            return True
+
+    def flush(self):
+        """Write the pending snapshot now, if any; returns False when that failed."""
+        with self.condition:
+            snapshot = self.pending
+            self.pending = None
+        if snapshot is None:
+            return True
+        return self._write(*snapshot)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(camera=DEFAULT_CAMERA):
+    """Return the background writer of a camera."""
+    with _writers_lock:
+        if camera not in _writers:
+            _writers[camera] = LayoutWriter(layout_path(camera))
+        return _writers[camera]
+
+
+@atexit.register
+def flush_all():
+    """Write every pending layout before the process exits."""
+    for writer in list(_writers.values()):
+        writer.flush()
@@ -0,0 +1,346 @@
+"""Load test of server.py on localhost.
+
+Starts a fake producer that speaks the main1.py stream protocol, runs
+server.py against it in a subprocess and opens simulated MJPEG viewers
+(some of them deliberately slow) and /stats pollers. Reports per-viewer frame
+rate and capture-to-viewer latency, poller response times and the server's
+CPU, RSS and thread count.
+
+    python loadtest.py --viewers 20 --slow-viewers 5 --pollers 50 --duration 30
+"""
+
+import argparse
+import http.client
+import json
+import os
+import pickle
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from metrics import summarize
+
+STREAMING_PORT = 9999
+SERVER_PORT = 3000
+BOUNDARY = b"--frame\r\n"
+
+
+class FakeProducer:
+    """Streams synthetic frames and stats the way main1.py does."""
+
+    def __init__(self, port, fps, frame_size, spaces=100, quality=70):
+        self.port = port
+        self.fps = fps
+        self.spaces = spaces
+        self.running = True
+        self.sent = 0
+
+        # A few pre-encoded frames, so the producer itself costs almost nothing
+        width, height = frame_size
+        rng = np.random.default_rng(0)
+        background = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        self.frames = [cv2.imencode('.jpg', np.roll(background, i * 16, axis=1), params)[1].tobytes()
+                       for i in range(8)]
+
+    def start(self):
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind(('127.0.0.1', self.port))
+        self.server_socket.listen(5)
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while self.running:
+            client_socket, addr = self.server_socket.accept()
+            try:
+                self._stream(client_socket)
+            except OSError:
+                pass
+            finally:
+                client_socket.close()
+
+    def _stream(self, client_socket):
+        interval = 1.0 / self.fps
+        next_time = time.monotonic()
+        seq = 0
+        while self.running:
+            seq += 1
+            occupied = np.random.default_rng(seq).random(self.spaces) < 0.5
+            occupied_count = int(occupied.sum())
+            data = pickle.dumps({
+                'stats': {
+                    'total_spaces': self.spaces,
+                    'free_spaces': self.spaces - occupied_count,
+                    'occupied_spaces': occupied_count,
+                    'occupancy_rate': round(occupied_count / self.spaces * 100, 1),
+                },
+                'spaces': np.packbits(occupied).tobytes(),
+                'seq': seq,
+                'capture_ts': time.time(),
+                'frame': self.frames[seq % len(self.frames)],
+            })
+            client_socket.sendall(struct.pack("L", len(data)) + data)
+            self.sent += 1
+
+            next_time += interval
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.monotonic()
+
+
+class Viewer(threading.Thread):
+    """Reads /video_feed, optionally throttled to `rate` bytes per second."""
+
+    def __init__(self, host, port, path, deadline, rate=None):
+        super().__init__(daemon=True)
+        self.host, self.port, self.path = host, port, path
+        self.deadline = deadline
+        self.rate = rate
+        self.frames = 0
+        self.bytes = 0
+        self.latencies = []
+        self.error = None
+        self.started = None
+
+    def run(self):
+        try:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=10)
+            conn.request("GET", self.path)
+            response = conn.getresponse()
+            self.started = time.monotonic()
+            buffer = b""
+            while time.monotonic() < self.deadline:
+                chunk = response.read1(16384)
+                if not chunk:
+                    break
+                self.bytes += len(chunk)
+                buffer += chunk
+                buffer = self._parse(buffer)
+                if self.rate:
+                    time.sleep(len(chunk) / self.rate)
+            conn.close()
+        except Exception as e:
+            self.error = str(e)
+
+    def _parse(self, buffer):
+        # Every part starts with the boundary followed by its headers
+        while True:
+            start = buffer.find(BOUNDARY)
+            if start < 0:
+                return buffer[-len(BOUNDARY):]
+            header_end = buffer.find(b"\r\n\r\n", start)
+            if header_end < 0:
+                return buffer[start:]
+            headers = buffer[start + len(BOUNDARY):header_end].decode("latin-1")
+            self.frames += 1
+            for line in headers.split("\r\n"):
+                name, _, value = line.partition(":")
+                if name.lower() == "x-capture-timestamp":
+                    self.latencies.append(time.time() - float(value))
+            buffer = buffer[header_end + 4:]
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6) if self.started else 0
+        return {
+            'fps': round(self.frames / elapsed, 2) if elapsed else 0,
+            'frames': self.frames,
+            'mbit_s': round(self.bytes * 8 / elapsed / 1e6, 2) if elapsed else 0,
+            'latency_s': summarize(self.latencies),
+            'slow': bool(self.rate),
+            'error': self.error,
+        }
+
+
+class StatsPoller(threading.Thread):
+    """Polls /stats like the web page does."""
+
+    def __init__(self, host, port, deadline, interval):
+        super().__init__(daemon=True)
+        self.host, self.port = host, port
+        self.deadline = deadline
+        self.interval = interval
+        self.times = []
+        self.errors = 0
+
+    def run(self):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=10)
+        while time.monotonic() < self.deadline:
+            start = time.monotonic()
+            try:
+                conn.request("GET", "/stats")
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    self.errors += 1
+                self.times.append(time.monotonic() - start)
+            except Exception:
+                self.errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=10)
+            time.sleep(max(0.0, self.interval - (time.monotonic() - start)))
+
+
+class ProcessSampler(threading.Thread):
+    """Samples CPU, RSS and threads of a process from /proc (Linux)."""
+
+    def __init__(self, pid, interval=1.0):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.running = True
+        self.cpu = []
+        self.rss_mb = []
+        self.threads = []
+
+    def _cpu_seconds(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def _status(self):
+        values = {}
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                values[name] = value.split()
+        return int(values['VmRSS'][0]) / 1024, int(values['Threads'][0])
+
+    def run(self):
+        try:
+            last_cpu, last_time = self._cpu_seconds(), time.monotonic()
+            while self.running:
+                time.sleep(self.interval)
+                cpu, now = self._cpu_seconds(), time.monotonic()
+                self.cpu.append((cpu - last_cpu) / (now - last_time) * 100)
+                last_cpu, last_time = cpu, now
+                rss, threads = self._status()
+                self.rss_mb.append(rss)
+                self.threads.append(threads)
+        except (OSError, KeyError, IndexError):
+            pass
+
+    def report(self):
+        if not self.cpu:
+            return {'available': False}
+        return {
+            'cpu_percent_mean': round(sum(self.cpu) / len(self.cpu), 1),
+            'cpu_percent_max': round(max(self.cpu), 1),
+            'rss_mb_max': round(max(self.rss_mb), 1),
+            'threads_max': max(self.threads),
+        }
+
+
+def start_server_process(server_port, streaming_port, workdir):
+    """Run server.py in a subprocess, connected to the local fake producer.
+
+    The server runs in `workdir`, where its history, recordings and templates
+    go, so a load test leaves nothing behind in the working tree.
+    """
+    repo = os.path.dirname(os.path.abspath(__file__))
+    code = (f"import sys; sys.path.insert(0, {repo!r}); "
+            "import server; server.STREAMING_HOST = '127.0.0.1'; "
+            f"server.STREAMING_PORT = {streaming_port}; server.SERVER_PORT = {server_port}; "
+            "server.start_server()")
+    return subprocess.Popen([sys.executable, "-c", code], cwd=workdir,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(port, timeout=30):
+    """Wait until server.py answers /ready with 200."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request("GET", "/ready")
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test server.py on localhost")
+    parser.add_argument("--viewers", type=int, default=10, help="Full-speed /video_feed viewers")
+    parser.add_argument("--slow-viewers", type=int, default=2, help="Throttled /video_feed viewers")
+    parser.add_argument("--slow-rate", type=float, default=256, help="Throttled viewer speed in KB/s")
+    parser.add_argument("--pollers", type=int, default=10, help="/stats pollers")
+    parser.add_argument("--poll-interval", type=float, default=1.5, help="Seconds between polls")
+    parser.add_argument("--fps", type=float, default=25, help="Producer frame rate")
+    parser.add_argument("--width", type=int, default=960, help="Producer frame width")
+    parser.add_argument("--height", type=int, default=540, help="Producer frame height")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load")
+    parser.add_argument("--streaming-port", type=int, default=STREAMING_PORT)
+    parser.add_argument("--server-port", type=int, default=SERVER_PORT)
+    parser.add_argument("--out", default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    producer = FakeProducer(args.streaming_port, args.fps, (args.width, args.height))
+    producer.start()
+    workdir = tempfile.TemporaryDirectory(prefix="loadtest-")
+    server = start_server_process(args.server_port, args.streaming_port, workdir.name)
+    try:
+        if not wait_ready(args.server_port):
+            print("server.py did not become ready")
+            return 1
+
+        sampler = ProcessSampler(server.pid)
+        sampler.start()
+        deadline = time.monotonic() + args.duration
+        viewers = [Viewer('127.0.0.1', args.server_port, "/video_feed", deadline)
+                   for _ in range(args.viewers)]
+        viewers += [Viewer('127.0.0.1', args.server_port, "/video_feed", deadline, args.slow_rate * 1024)
+                    for _ in range(args.slow_viewers)]
+        pollers = [StatsPoller('127.0.0.1', args.server_port, deadline, args.poll_interval)
+                   for _ in range(args.pollers)]
+        for client in viewers + pollers:
+            client.start()
+        for client in viewers + pollers:
+            client.join(args.duration + 15)
+        sampler.running = False
+        sampler.join()
+    finally:
+        producer.running = False
+        server.terminate()
+        server.wait()
+        workdir.cleanup()
+
+    viewer_reports = [v.report() for v in viewers]
+    fast = [r['fps'] for r in viewer_reports if not r['slow']]
+    slow = [r['fps'] for r in viewer_reports if r['slow']]
+    report = {
+        'config': vars(args),
+        'producer_frames': producer.sent,
+        'viewers': viewer_reports,
+        'viewer_fps': {'fast': summarize(fast), 'slow': summarize(slow)},
+        'viewer_latency_s': summarize([x for v in viewers for x in v.latencies]),
+        'stats_response_s': summarize([x for p in pollers for x in p.times]),
+        'stats_errors': sum(p.errors for p in pollers),
+        'server': sampler.report(),
+    }
+
+    print(f"Producer frames sent: {producer.sent}")
+    print(f"Viewer FPS fast: {report['viewer_fps']['fast']}")
+    print(f"Viewer FPS slow: {report['viewer_fps']['slow']}")
+    print(f"Capture-to-viewer latency (s): {report['viewer_latency_s']}")
+    print(f"/stats response (s): {report['stats_response_s']}, errors: {report['stats_errors']}")
+    print(f"Server: {report['server']}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
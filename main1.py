@@ -4,16 +4,57 @@ import threading
 import socket
 import pickle
 import struct
-from functions import find_polygon_center, save_object, load_object, is_point_in_polygon, get_label_name
-from ultralytics import YOLO
+from functions import save_object, is_point_in_polygon, get_label_name
+from occupancy import compile_layout
+from config import load_config, validate_config
+from control import RuntimeControl
+from inference import load_model, model_imgsz, preload, set_threads
+from layout_store import DEFAULT_CAMERA, load_camera_layout, space_attributes
+from metrics import Metrics
+from buffer_pool import LatestFrame
+from pipeline import FrameProcessor, encode_jpeg
+from tasks import BackgroundTask
 import time
 
+# Camera whose layout and config/<camera>.json are used
+CAMERA = DEFAULT_CAMERA
+
 # Configuration for streaming
 STREAMING_HOST = '0.0.0.0'
 STREAMING_PORT = 9999
 JPEG_QUALITY = 70
 FRAME_WIDTH = 960
 FRAME_HEIGHT = 540
+INFERENCE_SIZE = None  # None runs the model at the size it was trained at
+MODEL_FORMAT = ""
+OCCUPANCY_MODE = "center"
+OVERLAP_THRESHOLD = 0.4
+# Producer metrics are forwarded to server.py this often
+METRICS_INTERVAL = 1.0
+# The editor redraws this often (ms), independent of the inference rate
+DISPLAY_INTERVAL = 15
+
+# Stage timers, counters and gauges of this process
+metrics = Metrics()
+
+def apply_settings(config):
+    """Apply frame size and encoding settings from a camera config; a bad config changes nothing"""
+    global FRAME_WIDTH, FRAME_HEIGHT, JPEG_QUALITY, INFERENCE_SIZE, MODEL_FORMAT, OCCUPANCY_MODE, OVERLAP_THRESHOLD
+    try:
+        config = validate_config(config)
+        set_threads(config['torch_threads'])
+    except Exception as e:
+        print(f"Settings not applied: {e}")
+        return False
+    FRAME_WIDTH = config['frame_width']
+    FRAME_HEIGHT = config['frame_height']
+    JPEG_QUALITY = config['jpeg_quality']
+    INFERENCE_SIZE = config['imgsz']
+    MODEL_FORMAT = config['model_format']
+    OCCUPANCY_MODE = config['occupancy_mode']
+    OVERLAP_THRESHOLD = config['overlap_threshold']
+    metrics.sample_every = config['metrics_sample_every']
+    return True
 
 # Flag to control streaming
 streaming_enabled = True
@@ -33,7 +74,9 @@ def start_stream_server():
         try:
             client_socket, addr = server_socket.accept()
             print(f"Connection from {addr}")
+            metrics.set_gauge('stream_clients', 1)
             handle_client(client_socket)
+            metrics.set_gauge('stream_clients', 0)
         except Exception as e:
             print(f"Stream server error: {e}")
     
@@ -41,55 +84,86 @@ def start_stream_server():
 
 def handle_client(client_socket):
     """Handle client connection for streaming"""
-    global processed_frame, streaming_stats
-    
+    last_seq = None
+    last_metrics = 0
+    last_groups = None
+    encoded_seq = None
+    encoded_frame = None
     try:
         while streaming_enabled:
-            if processed_frame is not None and streaming_stats is not None:
-                # Prepare data packet with frame and stats
+            # The frame and everything about it, published together
+            slot, info = processed_frame.take()
+            if slot is None:
+                time.sleep(0.04)
+                continue
+            try:
+                seq = info.seq
+                if seq == last_seq:
+                    metrics.inc('frames_resent_total')
+                elif last_seq is not None and seq > last_seq + 1:
+                    # Frames processed while the previous packet was being sent
+                    metrics.inc('frames_dropped_total', seq - last_seq - 1)
+                last_seq = seq
+                lap = metrics.start_frame(seq)
+                
+                # Prepare data packet with frame, stats, per-space states and the
+                # frame's sequence number and capture time for latency tracing
                 data = {
-                    'stats': streaming_stats
+                    'stats': info.stats,
+                    'spaces': info.spaces,
+                    'seq': seq,
+                    'capture_ts': info.capture_ts
                 }
+                if time.monotonic() - last_metrics >= METRICS_INTERVAL:
+                    data['metrics'] = metrics.snapshot()
+                    last_metrics = time.monotonic()
+                # Group counts only when they changed
+                if info.groups is not last_groups:
+                    data['groups'] = info.groups
+                    last_groups = info.groups
                 
-                # Encode frame as JPEG
-                encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY]
-                _, encoded_frame = cv2.imencode('.jpg', processed_frame, encode_params)
-                
-                # Create data packet
-                data['frame'] = encoded_frame.tobytes()
-                
-                # Serialize data
-                data_bytes = pickle.dumps(data)
-                
-                # Send message size followed by data
-                message_size = struct.pack("L", len(data_bytes))
-                client_socket.sendall(message_size + data_bytes)
-                
-                # Rate limiting to ~25 FPS
-                time.sleep(0.04)
+                # Encode each processed frame as JPEG once, resends reuse it
+                if seq != encoded_seq:
+                    encoded_frame = encode_jpeg(slot.array, JPEG_QUALITY)
+                    encoded_seq = seq
+                    lap = metrics.lap('encode', lap)
+            finally:
+                slot.release()
+            
+            # Create data packet
+            data['frame'] = encoded_frame
+            
+            # Serialize data
+            data_bytes = pickle.dumps(data)
+            
+            # Send message size followed by data
+            message_size = struct.pack("L", len(data_bytes))
+            client_socket.sendall(message_size + data_bytes)
+            metrics.lap('send', lap)
+            metrics.inc('bytes_sent_total', len(data_bytes))
+            
+            # Rate limiting to ~25 FPS
+            time.sleep(0.04)
     except Exception as e:
         print(f"Error streaming to client: {e}")
     finally:
         client_socket.close()
 
-# Global variables to store processed frame and stats
-processed_frame = None
-streaming_stats = None
-
-# Start streaming server in a separate thread
-streaming_thread = threading.Thread(target=start_stream_server)
-streaming_thread.daemon = True
-streaming_thread.start()
+# The last processed frame, a pooled slot with its FrameInfo
+processed_frame = LatestFrame()
 
-def auto_detect_parking_spaces(frame, model):
-    """Automatically detect parking spaces from vehicles in the frame"""
-    # Detect vehicles in the frame
-    results = model(frame, device='cpu')[0]
+def auto_detect_parking_spaces(results, task=None):
+    """Automatically detect parking spaces from the vehicles detected in the current frame"""
     auto_spaces = []
     
     box_width, box_height = 80, 160  # Default values
+    if results is None:
+        return auto_spaces, box_width, box_height
     
-    for detection in results.boxes.data.tolist():
+    detections = results.boxes.data.tolist()
+    for i, detection in enumerate(detections):
+        if task is not None:
+            task.progress = i / len(detections)
         x1, y1, x2, y2, score, class_id = detection
         label_name = get_label_name(class_id)
         
@@ -114,13 +188,22 @@ def auto_detect_parking_spaces(frame, model):
 
 # Main processing code
 def main():
-    global processed_frame, streaming_stats
+    global streaming_enabled
     
-    # Load a pretrained YOLOv8n model
-    model = YOLO("Models/yolov8m mAp 48/weights/best.pt")
+    # Import ultralytics/torch while the config, layout and video are being opened
+    preload()
+    config = load_config(CAMERA)
+    apply_settings(config)
+
+    # Layout files, config and HTTP commands can change these while running;
+    # its /ready probe reports 503 until frames are produced
+    control = RuntimeControl(CAMERA, config)
+    control.start()
+    auto_layout = control.auto_layout
 
-    # List to store points
-    polygon_data = load_object()
+    # List to store points, and the attributes of every space kept in step with it
+    polygon_data, layout_meta = load_camera_layout(CAMERA)
+    space_meta = space_attributes(layout_meta, len(polygon_data))
     points = []
 
     # Variables for modes
@@ -136,6 +219,25 @@ def main():
     # Template for adding new polygons
     template_polygon = []  # Will store the shape of the last drawn polygon
 
+    def current_meta():
+        """Layout metadata with the current space attributes"""
+        meta = dict(layout_meta)
+        meta.pop('spaces', None)
+        if any(space_meta):
+            meta['spaces'] = [dict(s) for s in space_meta]
+        return meta
+
+    # Compiled layout the video loop uses; the editor replaces it as a whole
+    # after every edit and the loop picks it up at its next frame, without locks
+    published_layout = compile_layout(polygon_data, current_meta())
+
+    def layout_changed():
+        """Save the edited layout in the background and publish it to the video loop"""
+        nonlocal published_layout
+        meta = current_meta()
+        save_object(polygon_data, CAMERA, meta)
+        published_layout = compile_layout(polygon_data, meta)
+
     def draw_polygon(event, x, y, flags, param):
         nonlocal current_mode, polygon_data, points, template_polygon
         
@@ -152,9 +254,10 @@ def main():
                 # Remove polygons from highest index to lowest to avoid index shifting
                 for i in sorted(to_remove, reverse=True):
                     polygon_data.pop(i)
+                    space_meta.pop(i)
                 
                 if to_remove:
-                    save_object(polygon_data)
+                    layout_changed()
                     print(f"Removed {len(to_remove)} polygons")
             elif current_mode == MODE_ADD_BOX:
                 if template_polygon:
@@ -174,13 +277,21 @@ def main():
                         new_polygon.append(new_point)
                     
                     polygon_data.append(new_polygon)
-                    save_object(polygon_data)
+                    space_meta.append({})
+                    layout_changed()
                     print(f"Added new parking space at ({x}, {y}) with the same shape as template")
                 else:
                     print("No template polygon available. Draw and save a polygon first.")
 
     # Create a window and bind the function to it
     cap = cv2.VideoCapture("Media/video4.mp4")
+    
+    # Load a model warmed up at the configured size, then accept stream clients
+    model = load_model(config['model_path'], (FRAME_WIDTH, FRAME_HEIGHT),
+                       config['imgsz'], config['model_format'])
+    streaming_thread = threading.Thread(target=start_stream_server)
+    streaming_thread.daemon = True
+    streaming_thread.start()
     cv2.namedWindow("image")
     cv2.setMouseCallback("image", draw_polygon)
 
@@ -197,60 +308,118 @@ def main():
     # Update mouse callback to track movement
     cv2.setMouseCallback("image", mouse_move)
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            # Loop the video if it ends
-            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    # Set by the video loop for the editor: the layout of the latest frame and its detections
+    shown_layout = None
+    latest_results = None
+    running = True
+
+    def video_loop():
+        """Read, detect and publish frames until the editor quits"""
+        nonlocal model, shown_layout, latest_results, running
+
+        raw = None  # Reused decoded frame
+        processor = FrameProcessor(metrics)
+
+        try:
+            while running:
+                lap = metrics.start_frame()
+                ret, decoded = cap.read(raw)
+                if not ret:
+                    # Loop the video if it ends
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                raw = decoded
+                capture_ts = time.time()
+                lap = metrics.lap('decode', lap)
+
+                # Swap in reloaded model and settings, and the editor's latest layout, at the frame boundary
+                pending = control.take_pending(('model', 'settings'))
+                if 'model' in pending:
+                    model = pending['model']
+                if 'settings' in pending:
+                    apply_settings(pending['settings'])
+                layout = published_layout
+
+                slot, info, detections, lap = processor.process(
+                    raw, model, layout, (FRAME_WIDTH, FRAME_HEIGHT), model_imgsz(model, INFERENCE_SIZE),
+                    MODEL_FORMAT, OCCUPANCY_MODE, OVERLAP_THRESHOLD, capture_ts, lap)
+                frame = slot.array
+                # Learn the auto layout from the same detections, sampled about once a second
+                auto_layout.update(detections.boxes, capture_ts)
+
+                # Preview the auto layout proposal
+                if auto_layout.enabled:
+                    proposal = auto_layout.proposal()
+                    for polygon in proposal:
+                        cv2.polylines(frame, [np.array(polygon, np.int32)], True, (255, 255, 0), 1)
+                    cv2.putText(frame,
+                                f"Auto layout: {len(proposal)} spaces proposed (A to accept)",
+                                (50, 200),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.8,
+                                (255, 255, 0),
+                                2,
+                                cv2.LINE_4)
+                lap = metrics.lap('overlay', lap)
+
+                # Publish the processed frame for streaming and the editor, without copying it
+                shown_layout, latest_results = layout, detections.results
+                processed_frame.publish(slot, info)
+                control.mark_frame()
+                metrics.frame_done()
+
+                # The published reference keeps the frame alive for the stream
+                slot.release()
+        finally:
+            running = False
+
+    def detect_spaces(task, results):
+        """Spaces of the auto layout proposal, else of the vehicles in the latest frame, with the box size"""
+        proposal = auto_layout.proposal() if auto_layout.enabled else []
+        if proposal:
+            # Accept the spaces learned over time
+            return proposal, None
+        auto_spaces, new_box_width, new_box_height = auto_detect_parking_spaces(results, task)
+        return auto_spaces, (new_box_width, new_box_height)
+
+    # Inference runs on its own thread; this thread draws the editor at display rate
+    video_thread = threading.Thread(target=video_loop, daemon=True)
+    video_thread.start()
+    display = None  # Copy of the latest frame with the editor drawn on it
+    task = None  # Long editor operation in progress
+
+    while running:
+        start = time.perf_counter()
+
+        # A layout reloaded from disk replaces the edited one
+        pending = control.take_pending(('layout', 'layout_change'))
+        if 'layout' in pending:
+            polygon_data, published_layout = pending['layout']
+            layout_meta, space_meta = published_layout.meta, [dict(s) for s in published_layout.spaces]
+            polygon_data = [list(polygon) for polygon in polygon_data]
+        # A change over HTTP is made to the layout as edited so far, and saved from here like any edit
+        if 'layout_change' in pending:
+            changed = pending['layout_change'].apply([list(polygon) for polygon in polygon_data], current_meta())
+            if changed is not None:
+                polygon_data, layout_meta, published_layout = changed
+                space_meta = space_attributes(layout_meta, len(polygon_data))
+                polygon_data = [list(polygon) for polygon in polygon_data]
+                save_object(polygon_data, CAMERA, layout_meta)
+
+        slot, _ = processed_frame.take()
+        if slot is None:
+            # No frame processed yet, the model is still warming up
+            time.sleep(DISPLAY_INTERVAL / 1000)
             continue
-        
-        frame = cv2.resize(frame, (FRAME_WIDTH, FRAME_HEIGHT))
-        mask_1 = np.zeros_like(frame)
-        mask_2 = np.zeros_like(frame)
-        
-        results = model(frame, device='cpu')[0]
-        polygon_data_copy = polygon_data.copy()
-        
-        for detection in results.boxes.data.tolist():
-            x1, y1, x2, y2, score, class_id = detection
-            label_name = get_label_name(class_id)
-            
-            if label_name in ["bicycle", "car", "van", "truck", "tricycle", "awning-tricycle", "bus", "motor"]:
-                car_polygon = [(int(x1), int(y1)), (int(x1), int(y2)), (int(x2), int(y2)), (int(x2), int(y1))]
-                
-                for cou, i in enumerate(polygon_data_copy):
-                    poligon_center = find_polygon_center(i)
-                    is_present = is_point_in_polygon(poligon_center, car_polygon)
-                    if is_present:
-                        cv2.fillPoly(mask_1, [np.array(i)], (0, 0, 255))
-                        polygon_data_copy.remove(i)
-        
-        # Update stats for streaming
-        total_spaces = len(polygon_data)
-        free_spaces = len(polygon_data_copy)
-        streaming_stats = {
-            'total_spaces': total_spaces,
-            'free_spaces': free_spaces,
-            'occupied_spaces': total_spaces - free_spaces,
-            'occupancy_rate': round((total_spaces - free_spaces) / total_spaces * 100, 1) if total_spaces > 0 else 0
-        }
-        
-        cv2.putText(frame,
-                    f'Total space : {total_spaces}',
-                    (50, 50),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1,
-                    (8, 210, 255),
-                    2,
-                    cv2.LINE_4)
-        
-        cv2.putText(frame,
-                    f'Free space : {free_spaces}',
-                    (50, 100),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1,
-                    (8, 210, 90),
-                    3,
-                    cv2.LINE_4)
-        
+        if display is None or display.shape != slot.array.shape:
+            display = np.empty_like(slot.array)
+        np.copyto(display, slot.array)
+        slot.release()
+
+        # Outline edits the video loop has not picked up yet
+        if shown_layout is not published_layout:
+            cv2.polylines(display, [np.array(p, np.int32) for p in polygon_data if len(p) > 1],
+                          True, (255, 255, 255), 1)
+
         # Display current mode
         mode_text = "Mode: "
         if current_mode == MODE_DRAW_POLYGON:
@@ -263,7 +432,7 @@ def main():
             else:
                 mode_text += "Add Box (No Template)"
         
-        cv2.putText(frame,
+        cv2.putText(display,
                     mode_text,
                     (50, 150),
                     cv2.FONT_HERSHEY_SIMPLEX, 1,
@@ -271,16 +440,10 @@ def main():
                     2,
                     cv2.LINE_4)
         
-        for i in polygon_data_copy:
-            cv2.fillPoly(mask_2, [np.array(i)], (0, 255, 255))
-        
-        frame = cv2.addWeighted(mask_1, 0.2, frame, 1, 0)
-        frame = cv2.addWeighted(mask_2, 0.2, frame, 1, 0)
-        
         # Draw the points of the current polygon
         if current_mode == MODE_DRAW_POLYGON:
             for x, y in points:
-                cv2.circle(frame, (x, y), 3, (0, 0, 255), -1)
+                cv2.circle(display, (x, y), 3, (0, 0, 255), -1)
         
         # Draw a preview box for add box mode
         if current_mode == MODE_ADD_BOX and template_polygon and mouse_x >= 0 and mouse_y >= 0:
@@ -302,39 +465,69 @@ def main():
             
             # Draw the preview polygon
             preview_polygon = np.array(preview_points, np.int32)
-            cv2.polylines(frame, [preview_polygon], True, (0, 255, 0), 2)
+            cv2.polylines(display, [preview_polygon], True, (0, 255, 0), 2)
         
-        # Store the processed frame for streaming
-        processed_frame = frame.copy()
+        # Show the progress of a long operation, and apply its result once done
+        if task is not None and not task.done:
+            cv2.putText(display,
+                        task.status(),
+                        (50, 250),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.8,
+                        (0, 255, 255),
+                        2,
+                        cv2.LINE_4)
+            if task.progress is not None:
+                cv2.rectangle(display, (50, 265), (50 + int(300 * task.progress), 275), (0, 255, 255), -1)
+        elif task is not None:
+            if task.error is not None:
+                print(f"{task.name} failed: {task.error}")
+            else:
+                auto_spaces, box_size = task.result
+                polygon_data = auto_spaces
+                space_meta = [{} for _ in polygon_data]
+                layout_changed()
+                if box_size is None:
+                    print(f"Accepted auto layout with {len(polygon_data)} parking spaces")
+                else:
+                    box_width, box_height = box_size
+                    print(f"Auto-detected {len(polygon_data)} parking spaces")
+            task = None
         
-        cv2.imshow("image", frame)
+        cv2.imshow("image", display)
+        metrics.observe('display', time.perf_counter() - start)
         
-        wail_key = cv2.waitKey(1)
+        wail_key = cv2.waitKey(DISPLAY_INTERVAL)
         if wail_key == ord("s") or wail_key == ord("S"):
             if current_mode == MODE_DRAW_POLYGON and len(points) > 0:
                 # Save the current polygon as the template for future use
                 template_polygon = points.copy()
                 
                 polygon_data.append(points)
+                space_meta.append({})
                 points = []
-                save_object(polygon_data)
+                layout_changed()
                 print(f"Saved polygon with {len(template_polygon)} points as template")
         elif wail_key == ord("r") or wail_key == ord("R"):
             try:
                 polygon_data.pop()
-                save_object(polygon_data)
+                space_meta.pop()
+                layout_changed()
             except:
                 pass
         elif wail_key == ord("c") or wail_key == ord("C"):  # Clear all polygons
             polygon_data = []
-            save_object(polygon_data)
+            space_meta = []
+            layout_changed()
             print("All parking spaces cleared")
         elif wail_key == ord("a") or wail_key == ord("A"):  # Auto-detect parking spaces
-            auto_spaces, new_box_width, new_box_height = auto_detect_parking_spaces(frame, model)
-            polygon_data = auto_spaces
-            box_width, box_height = new_box_width, new_box_height
-            save_object(polygon_data)
-            print(f"Auto-detected {len(polygon_data)} parking spaces")
+            if task is not None:
+                print(f"Still busy: {task.status()}")
+            else:
+                # Runs in the background; the result is applied above once it is done
+                task = BackgroundTask("Detecting parking spaces", detect_spaces, latest_results)
+        elif wail_key == ord("l") or wail_key == ord("L"):  # Toggle the auto layout builder
+            auto_layout.enabled = not auto_layout.enabled
+            print(f"Auto layout {'enabled' if auto_layout.enabled else 'disabled'}")
         elif wail_key == ord("d") or wail_key == ord("D"):  # Switch to Draw Polygon mode
             current_mode = MODE_DRAW_POLYGON
             points = []  # Clear current points
@@ -354,9 +547,11 @@ def main():
             break
 
     # Clean up before exit
+    running = False
     streaming_enabled = False
+    video_thread.join()
     cap.release()
     cv2.destroyAllWindows()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,206 @@
+"""Low-overhead pipeline instrumentation.
+
+Stage durations go into fixed-bucket histograms, from which p50/p95/p99 are
+estimated; counters and gauges cover frames, FPS, drops and queue depths.
+Timing uses laps so a frame costs one perf_counter() call per stage:
+
+    lap = metrics.start_frame()        # None when this frame is not sampled
+    ...decode...
+    lap = metrics.lap('decode', lap)
+    ...inference...
+    lap = metrics.lap('inference', lap)
+
+Snapshots are plain dicts so the producer can forward them inside the stream,
+and `render_prometheus` turns them into Prometheus text.
+"""
+
+import bisect
+import collections
+import threading
+import time
+
+# Histogram upper bounds in seconds: 0.1 ms to ~13 s, 25% apart
+BUCKETS = tuple(round(0.0001 * 1.25 ** i, 7) for i in range(54))
+
+
+class Histogram:
+    """Fixed-bucket histogram of durations in seconds."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def quantile(counts, q):
+    """Estimate a quantile from histogram bucket counts."""
+    total = sum(counts)
+    if total == 0:
+        return 0.0
+    rank = q * total
+    seen = 0
+    for i, n in enumerate(counts):
+        seen += n
+        if seen >= rank:
+            return BUCKETS[min(i, len(BUCKETS) - 1)]
+    return BUCKETS[-1]
+
+
+class Metrics:
+    """Stage timers, counters and gauges of one process.
+
+    With `sample_every` N only every Nth frame is timed; 0 disables timing.
+    Counters and gauges are always kept.
+    """
+
+    def __init__(self, sample_every=1):
+        self.sample_every = sample_every
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.counters = {}
+        self.gauges = {}
+        self.frame = 0
+        self.fps_frames = 0
+        self.fps_start = time.perf_counter()
+
+    def start_frame(self, frame=None):
+        """Start timing a frame; returns a lap start, or None when not sampled.
+
+        Threads that handle frames counted elsewhere pass the frame number so
+        they sample the same frames.
+        """
+        if frame is None:
+            self.frame += 1
+            frame = self.frame
+        if self.sample_every <= 0 or frame % self.sample_every:
+            return None
+        return time.perf_counter()
+
+    def lap(self, stage, start):
+        """Record the time since `start` for `stage` and return the new lap start."""
+        if start is None:
+            return None
+        now = time.perf_counter()
+        self.observe(stage, now - start)
+        return now
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        self.gauges[name] = value
+
+    def frame_done(self):
+        """Count a finished frame and update the FPS gauge about once a second."""
+        self.inc('frames_total')
+        self.fps_frames += 1
+        now = time.perf_counter()
+        elapsed = now - self.fps_start
+        if elapsed >= 1.0:
+            self.gauges['fps'] = round(self.fps_frames / elapsed, 2)
+            self.fps_frames = 0
+            self.fps_start = now
+
+    def snapshot(self):
+        """Return a serializable copy of every metric."""
+        with self.lock:
+            return {
+                'stages': {name: {'counts': list(h.counts), 'sum': h.sum, 'count': h.count}
+                           for name, h in self.stages.items()},
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+            }
+
+
+class RollingWindow:
+    """The most recent samples of a value, summarized on demand."""
+
+    def __init__(self, size=1000):
+        self.samples = collections.deque(maxlen=size)
+
+    def add(self, value):
+        self.samples.append(value)
+
+    def summary(self):
+        """Return count, mean and p50/p95/p99 of the samples."""
+        return summarize(self.samples)
+
+
+def summarize(values):
+    """Return count, mean, p50/p95/p99 and max of some values."""
+    values = sorted(values)
+    if not values:
+        return {'count': 0}
+
+    def pick(q):
+        return round(values[min(int(q * len(values)), len(values) - 1)], 4)
+
+    return {
+        'count': len(values),
+        'mean': round(sum(values) / len(values), 4),
+        'p50': pick(0.5),
+        'p95': pick(0.95),
+        'p99': pick(0.99),
+        'max': round(values[-1], 4),
+    }
+
+
+def _labels(labels):
+    return ",".join(f'{k}="{v}"' for k, v in labels.items())
+
+
+def _series(name, labels):
+    return f"{name}{{{labels}}}" if labels else name
+
+
+def render_prometheus(snapshot, prefix, labels=None):
+    """Render a snapshot in the Prometheus text exposition format."""
+    return render_prometheus_series([(labels or {}, snapshot)], prefix)
+
+
+def render_prometheus_series(items, prefix):
+    """Render (labels, snapshot) pairs, e.g. one per camera, keeping each metric family together."""
+    lines = []
+
+    name = f"{prefix}_stage_seconds"
+    lines.append(f"# TYPE {name} histogram")
+    for labels, snapshot in items:
+        for stage, h in sorted(snapshot['stages'].items()):
+            stage_labels = _labels(dict(labels, stage=stage))
+            cumulative = 0
+            for bound, n in zip(BUCKETS, h['counts']):
+                cumulative += n
+                lines.append(f'{name}_bucket{{{stage_labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{stage_labels},le="+Inf"}} {h["count"]}')
+            lines.append(f"{name}_sum{{{stage_labels}}} {h['sum']:.6f}")
+            lines.append(f"{name}_count{{{stage_labels}}} {h['count']}")
+
+    name = f"{prefix}_stage_quantile_seconds"
+    lines.append(f"# TYPE {name} gauge")
+    for labels, snapshot in items:
+        for stage, h in sorted(snapshot['stages'].items()):
+            for q in (0.5, 0.95, 0.99):
+                q_labels = _labels(dict(labels, stage=stage, quantile=q))
+                lines.append(f"{name}{{{q_labels}}} {quantile(h['counts'], q)}")
+
+    for kind, key in (("counter", 'counters'), ("gauge", 'gauges')):
+        names = sorted({metric for labels, snapshot in items for metric in snapshot[key]})
+        for metric in names:
+            lines.append(f"# TYPE {prefix}_{metric} {kind}")
+            for labels, snapshot in items:
+                if metric in snapshot[key]:
+                    lines.append(f"{_series(f'{prefix}_{metric}', _labels(labels))} {snapshot[key][metric]}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,123 @@
+import numpy as np
+import shapely
+from functions import find_polygon_center, get_label_name
+from layout_store import space_attributes
+
+# Detection classes that can occupy a parking space
+VEHICLE_LABELS = ["bicycle", "car", "van", "truck", "tricycle", "awning-tricycle", "bus", "motor"]
+VEHICLE_CLASS_IDS = [n for n in range(10) if get_label_name(n) in VEHICLE_LABELS]
+
+# "center": a space is occupied when its center lies inside a vehicle box.
+# "overlap": when a vehicle box covers at least a threshold of its area.
+OCCUPANCY_MODES = ("center", "overlap")
+# Fraction of a space a vehicle must cover in overlap mode, unless the space
+# sets its own "threshold" attribute
+OVERLAP_THRESHOLD = 0.4
+
+
+class CompiledLayout:
+    """Parking layout prepared for fast per-frame occupancy checks."""
+
+    def __init__(self, polygon_data, meta=None):
+        self.polygons = [list(polygon) for polygon in polygon_data]
+        self.size = len(self.polygons)
+        self.meta = meta or {}
+        self.spaces = space_attributes(self.meta, self.size)
+        # Per-space overlap thresholds, NaN where the default applies
+        self.thresholds = np.array([space_threshold(i, s.get('threshold')) for i, s in enumerate(self.spaces)],
+                                   dtype=np.float64)
+        # int32 point arrays, ready for cv2 drawing calls
+        self.arrays = [np.array(p, dtype=np.int32) for p in self.polygons]
+        # Space centers as an (N, 2) array so every space is tested at once
+        self.centers = np.array([find_polygon_center(p) for p in self.polygons],
+                                dtype=np.float32).reshape(self.size, 2)
+        self._overlap_index = None
+
+    def overlap_index(self):
+        """Return (STRtree, space geometries, space areas), built on first use."""
+        if self._overlap_index is None:
+            geometries = np.full(self.size, shapely.Polygon(), dtype=object)
+            valid = np.array([len(p) >= 3 for p in self.polygons], dtype=bool)
+            if valid.any():
+                # One linear ring per space, built in a single vectorized call
+                coords = np.concatenate([self.arrays[i] for i in np.flatnonzero(valid)]).astype(np.float64)
+                ring_ids = np.repeat(np.arange(valid.sum()), [len(self.polygons[i]) for i in np.flatnonzero(valid)])
+                polygons = shapely.polygons(shapely.linearrings(coords, indices=ring_ids))
+                invalid = ~shapely.is_valid(polygons)
+                polygons[invalid] = shapely.make_valid(polygons[invalid])
+                geometries[valid] = polygons
+            self._overlap_index = (shapely.STRtree(geometries), geometries, shapely.area(geometries))
+        return self._overlap_index
+
+
+def valid_threshold(value):
+    """Tell whether `value` can be the "threshold" attribute of a space: a number in (0, 1]."""
+    return not isinstance(value, bool) and isinstance(value, (int, float)) and 0 < value <= 1
+
+
+def space_threshold(index, value):
+    """Return the threshold of a space, or NaN for the default when it is unset or invalid."""
+    if value is None:
+        return np.nan
+    if not valid_threshold(value):
+        print(f"Ignoring threshold {value!r} of space {index}: expected a number in (0, 1], "
+              f"using the default")
+        return np.nan
+    return float(value)
+
+
+def compile_layout(polygon_data, meta=None):
+    """Compile a list of polygons and the layout metadata into a CompiledLayout."""
+    return CompiledLayout(polygon_data, meta)
+
+
+def vehicle_boxes(results):
+    """Return the vehicle boxes of a YOLO result as an (M, 4) array of x1, y1, x2, y2."""
+    data = results.boxes.data
+    if hasattr(data, "cpu"):
+        data = data.cpu().numpy()
+    data = np.asarray(data, dtype=np.float32).reshape(-1, 6)
+    keep = np.isin(data[:, 5].astype(np.int64), VEHICLE_CLASS_IDS)
+    # Match the integer car polygons used by the interactive loop
+    return np.trunc(data[keep, :4])
+
+
+def overlap_scores(boxes, layout):
+    """Return, for every space, the largest fraction of its area covered by one vehicle box."""
+    scores = np.zeros(layout.size, dtype=np.float64)
+    if layout.size == 0 or len(boxes) == 0:
+        return scores
+
+    tree, geometries, areas = layout.overlap_index()
+    box_geometries = shapely.box(boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3])
+    # Candidate pairs whose bounding boxes intersect, then exact areas for those only
+    box_ids, space_ids = tree.query(box_geometries)
+    if len(space_ids) == 0:
+        return scores
+    covered = shapely.area(shapely.intersection(box_geometries[box_ids], geometries[space_ids]))
+    space_areas = areas[space_ids]
+    ratios = np.divide(covered, space_areas, out=np.zeros_like(covered), where=space_areas > 0)
+    np.maximum.at(scores, space_ids, ratios)
+    return scores
+
+
+def detect_occupancy(boxes, layout, mode="center", threshold=OVERLAP_THRESHOLD):
+    """Return a boolean array telling which spaces are occupied by a vehicle box.
+
+    In "center" mode a space is occupied when its center lies inside a box, in
+    "overlap" mode when a box covers at least its threshold of the space.
+    """
+    if layout.size == 0 or len(boxes) == 0:
+        return np.zeros(layout.size, dtype=bool)
+
+    if mode == "overlap":
+        thresholds = np.where(np.isnan(layout.thresholds), threshold, layout.thresholds)
+        return overlap_scores(boxes, layout) >= thresholds
+    if mode != "center":
+        raise ValueError(f"Unknown occupancy mode {mode!r}, expected one of {OCCUPANCY_MODES}")
+
+    cx = layout.centers[None, :, 0]
+    cy = layout.centers[None, :, 1]
+    x1, y1, x2, y2 = (boxes[:, i, None] for i in range(4))
+    inside = (cx > x1) & (cx <= x2) & (cy > y1) & (cy <= y2)
+    return inside.any(axis=0)
@@ -0,0 +1,99 @@
+"""Per-frame work of the main1.py video loop.
+
+A FrameProcessor resizes a decoded frame into a pooled slot, letterboxes it
+into the model input, detects vehicles, updates the space and group counts
+and draws the overlay on the slot. main1.py publishes the slot it returns;
+benchmark.py runs the same processor around a stub model.
+"""
+
+import collections
+
+import cv2
+import numpy as np
+
+from buffer_pool import FramePool
+from groups import GroupCounters
+from inference import detect, letterbox_for
+from occupancy import detect_occupancy, vehicle_boxes
+from render import draw_counts, draw_occupancy
+
+# What the video loop publishes with each processed frame, replaced as a whole
+FrameInfo = collections.namedtuple("FrameInfo", [
+    'seq',  # Number of the frame
+    'capture_ts',  # Wall-clock time the frame was read
+    'stats',
+    'spaces',  # Occupied flag of every space, packed to one bit each
+    'groups',  # {group: [total, occupied]}, a new dict only when a count changed
+])
+
+# What process() found in a frame, besides the slot and its FrameInfo
+Detections = collections.namedtuple("Detections", ['results', 'boxes', 'occupied'])
+
+
+class FrameProcessor:
+    """Processes frames with reused buffers: pooled frames, overlay masks and model input."""
+
+    def __init__(self, metrics, detector=detect):
+        self.metrics = metrics
+        self.detect = detector
+        self.pool = None
+        self.masks = None
+        self.letterbox = None
+        self.letterbox_settings = None
+        self.counters = None  # Lot and group counts of the layout
+        self.published_version = None
+        self.groups = None
+        self.seq = 0
+
+    def process(self, raw, model, layout, frame_size, imgsz, model_format, mode, threshold,
+                capture_ts, lap=None):
+        """Process one decoded frame.
+
+        Returns (slot, info, detections, lap): the slot holds the frame with
+        its overlay and a reference the caller must release.
+        """
+        metrics = self.metrics
+        width, height = frame_size
+        shape = (height, width, 3)
+        if self.pool is None or self.pool.shape != shape:
+            self.pool = FramePool(shape)
+            self.masks = (np.empty(shape, np.uint8), np.empty(shape, np.uint8))
+        slot = self.pool.acquire()
+        frame = cv2.resize(raw, frame_size, dst=slot.array)
+        # Letterbox the frame into the model input before anything is drawn on it
+        input_settings = (frame_size, imgsz, model_format)
+        if self.letterbox_settings != input_settings:
+            self.letterbox, self.letterbox_settings = letterbox_for(*input_settings), input_settings
+        lap = metrics.lap('resize', lap)
+
+        results = self.detect(model, self.letterbox, frame)
+        lap = metrics.lap('inference', lap)
+        counters = self.counters
+        if counters is None or counters.layout is not layout:
+            counters = self.counters = GroupCounters(layout)
+            self.published_version = None
+        boxes = vehicle_boxes(results)
+        occupied = detect_occupancy(boxes, layout, mode, threshold)
+
+        # Update stats for streaming from the spaces that changed
+        counters.update(occupied)
+        stats = counters.lot()
+        if counters.version != self.published_version:
+            self.groups = counters.snapshot()
+            self.published_version = counters.version
+        spaces = np.packbits(occupied).tobytes()
+        lap = metrics.lap('matching', lap)
+
+        draw_counts(frame, stats['total_spaces'], stats['free_spaces'])
+        draw_occupancy(frame, layout, occupied, self.masks)
+        metrics.set_gauge('pool_misses', self.pool.misses)
+
+        self.seq += 1
+        info = FrameInfo(self.seq, capture_ts, stats, spaces, self.groups)
+        return slot, info, Detections(results, boxes, occupied), lap
+
+
+def encode_jpeg(frame, quality):
+    """Encode a processed frame for the stream."""
+    _, encoded = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    return encoded.tobytes()
@@ -0,0 +1,64 @@
+"""Letterboxing frames straight into a reusable model input buffer.
+
+Passing a frame to `model(frame)` makes Ultralytics letterbox it, convert it
+from BGR to RGB, transpose it to CHW and scale it to 0-1, each into a new
+array. A Letterbox does the resize once, into a padded canvas it keeps, and
+fills a contiguous float32 (1, 3, H, W) input in one pass over the canvas.
+Boxes the model returns in input coordinates are mapped back to the frame
+with `to_frame`.
+"""
+
+import cv2
+import numpy as np
+
+# Padding value Ultralytics uses, so detections match its own letterbox
+PAD_VALUE = 114
+STRIDE = 32
+
+
+class Letterbox:
+    """Model input buffer of one frame size and input size."""
+
+    def __init__(self, frame_size, imgsz, rect=True, stride=STRIDE):
+        """With `rect` the input is padded to a multiple of `stride` only,
+        otherwise to a square `imgsz`, which exported models require."""
+        width, height = frame_size
+        self.frame_size = frame_size
+        self.imgsz = imgsz
+        self.rect = rect
+        self.scale = min(imgsz / width, imgsz / height)
+        self.resized = (max(1, round(width * self.scale)), max(1, round(height * self.scale)))
+        if rect:
+            input_w = -(-self.resized[0] // stride) * stride
+            input_h = -(-self.resized[1] // stride) * stride
+        else:
+            input_w = input_h = imgsz
+        self.input_size = (input_w, input_h)
+        self.left = (input_w - self.resized[0]) // 2
+        self.top = (input_h - self.resized[1]) // 2
+
+        # The padding is written once; each frame only overwrites the image area
+        self.canvas = np.full((input_h, input_w, 3), PAD_VALUE, np.uint8)
+        self.image = self.canvas[self.top:self.top + self.resized[1], self.left:self.left + self.resized[0]]
+        self.input = np.empty((1, 3, input_h, input_w), np.float32)
+        self._rgb_chw = self.canvas[..., ::-1].transpose(2, 0, 1)
+
+    def fill(self, frame):
+        """Letterbox `frame` into the input buffer and return the buffer."""
+        if frame.shape[1] == self.resized[0] and frame.shape[0] == self.resized[1]:
+            self.image[...] = frame
+        else:
+            cv2.resize(frame, self.resized, dst=self.image, interpolation=cv2.INTER_LINEAR)
+        # BGR HWC uint8 -> RGB CHW float 0-1 in a single pass
+        np.multiply(self._rgb_chw, np.float32(1 / 255), out=self.input[0], casting='unsafe')
+        return self.input
+
+    def to_frame(self, boxes):
+        """Map x1, y1, x2, y2 boxes from input to frame coordinates, in place."""
+        boxes[:, [0, 2]] -= self.left
+        boxes[:, [1, 3]] -= self.top
+        boxes /= self.scale
+        width, height = self.frame_size
+        boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, width)
+        boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, height)
+        return boxes
@@ -0,0 +1,187 @@
+"""Segmented recording of a camera's processed stream.
+
+Every recorded frame is appended to the current segment as
+
+    header  float64 capture time, uint32 sizes of the three parts below
+    meta    UTF-8 JSON with the frame's sequence number and stats
+    spaces  occupied flag of every space, packed to one bit each
+    jpeg    the producer's JPEG, stored as is
+
+and gets a fixed-width (ts, offset) record in the segment's index file. A
+new segment starts every `segment_seconds`, and the oldest segments are
+deleted once the recording outgrows `max_bytes`. Seeking finds the segment
+by its start time in the file name and the frame by a binary search of the
+memory-mapped index, so it is O(log n) however long the recording is.
+"""
+
+import bisect
+import glob
+import json
+import os
+import struct
+import threading
+
+import numpy as np
+
+INDEX_DTYPE = np.dtype([
+    ('ts', '<f8'),
+    ('offset', '<u8'),
+])
+RECORD_HEADER = struct.Struct("<dIII")
+
+
+class Recorder:
+    """Records frames of one camera and reads them back from any time."""
+
+    def __init__(self, root, segment_seconds=300, max_bytes=4 << 30, max_fps=5):
+        self.root = root
+        self.segment_seconds = segment_seconds
+        self.max_bytes = max_bytes
+        # Frames closer together than 1 / max_fps are not recorded; 0 records every frame
+        self.max_fps = max_fps
+        self.lock = threading.Lock()
+        self.data = None
+        self.index = None
+        self.segment_start = None
+        self.offset = 0
+        self.last_ts = None
+        os.makedirs(root, exist_ok=True)
+
+    def record(self, ts, meta, spaces, jpeg):
+        """Append a frame captured at `ts`; returns False when it was skipped."""
+        if self.last_ts is not None:
+            # Timestamps must increase within the index; rate limit too
+            if ts <= self.last_ts or (self.max_fps and ts - self.last_ts < 1 / self.max_fps):
+                return False
+        meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+        spaces = spaces or b""
+
+        with self.lock:
+            if self.data is None or ts - self.segment_start >= self.segment_seconds:
+                self._open_segment(ts)
+            self.data.write(b"".join((RECORD_HEADER.pack(ts, len(meta_bytes), len(spaces), len(jpeg)),
+                                      meta_bytes, spaces, jpeg)))
+            self.data.flush()
+            # The index entry is written after the frame, so readers never see a partial frame
+            entry = np.array([(ts, self.offset)], dtype=INDEX_DTYPE)
+            self.index.write(entry.tobytes())
+            self.index.flush()
+            self.offset += RECORD_HEADER.size + len(meta_bytes) + len(spaces) + len(jpeg)
+            self.last_ts = ts
+        return True
+
+    def _open_segment(self, ts):
+        self.close()
+        base = os.path.join(self.root, f"segment-{int(ts * 1000):015d}")
+        self.data = open(base + ".dat", "ab")
+        self.index = open(base + ".idx", "ab")
+        self.offset = self.data.tell()
+        self.segment_start = ts
+        self._enforce_retention()
+
+    def _enforce_retention(self):
+        segments = self.segments()
+        sizes = [os.path.getsize(base + ".dat") + os.path.getsize(base + ".idx") for _, base in segments]
+        total = sum(sizes)
+        # Never delete the segment being written, the last one
+        for (start, base), size in zip(segments[:-1], sizes):
+            if total <= self.max_bytes:
+                break
+            for ext in (".idx", ".dat"):
+                try:
+                    os.remove(base + ext)
+                except OSError:
+                    pass
+            total -= size
+
+    def close(self):
+        for f in (self.data, self.index):
+            if f is not None:
+                f.close()
+        self.data = self.index = None
+
+    def segments(self):
+        """Return (start_ts, base path) of every segment, oldest first."""
+        paths = sorted(glob.glob(os.path.join(self.root, "segment-*.idx")))
+        return [(_segment_start(p[:-4]), p[:-4]) for p in paths]
+
+    @staticmethod
+    def _index(base):
+        path = base + ".idx"
+        try:
+            count = os.path.getsize(path) // INDEX_DTYPE.itemsize
+        except OSError:
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        if count == 0:
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        return np.memmap(path, dtype=INDEX_DTYPE, mode="r", shape=(count,))
+
+    def locate(self, ts):
+        """Return (segment number, frame number) of the first frame at or after `ts`, or None."""
+        segments = self.segments()
+        starts = [start for start, _ in segments]
+        # The segment that started last at or before ts, then the ones after it
+        first = max(bisect.bisect_right(starts, ts) - 1, 0)
+        for number in range(first, len(segments)):
+            index = self._index(segments[number][1])
+            position = int(np.searchsorted(index['ts'], ts, side="left"))
+            if position < len(index):
+                return number, position
+        return None
+
+    @staticmethod
+    def _read(data, offset):
+        data.seek(offset)
+        ts, meta_size, spaces_size, jpeg_size = RECORD_HEADER.unpack(data.read(RECORD_HEADER.size))
+        meta = json.loads(data.read(meta_size).decode("utf-8"))
+        spaces = data.read(spaces_size)
+        return ts, meta, spaces, data.read(jpeg_size)
+
+    def _next_segment(self, base):
+        start = _segment_start(base)
+        return next((b for s, b in self.segments() if s > start), None)
+
+    def frames(self, start):
+        """Yield (ts, meta, spaces, jpeg) of every frame from `start` on, through the following segments."""
+        located = self.locate(start)
+        if located is None:
+            return
+        number, position = located
+        base = self.segments()[number][1]
+        while base is not None:
+            try:
+                with open(base + ".dat", "rb") as data:
+                    # Re-read the index until it stops growing, to follow the live segment
+                    while True:
+                        index = self._index(base)
+                        if position >= len(index):
+                            break
+                        for offset in index['offset'][position:].tolist():
+                            yield self._read(data, offset)
+                        position = len(index)
+            except FileNotFoundError:
+                pass  # Deleted by retention while replaying
+            base = self._next_segment(base)
+            position = 0
+
+    def state_at(self, ts):
+        """Return (ts, meta, spaces) of the last frame at or before `ts`, or None."""
+        segments = self.segments()
+        starts = [start for start, _ in segments]
+        for number in range(bisect.bisect_right(starts, ts) - 1, -1, -1):
+            base = segments[number][1]
+            index = self._index(base)
+            position = int(np.searchsorted(index['ts'], ts, side="right")) - 1
+            if position >= 0:
+                try:
+                    with open(base + ".dat", "rb") as data:
+                        frame_ts, meta, spaces, jpeg = self._read(data, int(index['offset'][position]))
+                except FileNotFoundError:
+                    return None
+                return frame_ts, meta, spaces
+        return None
+
+
+def _segment_start(base):
+    """Return the start time encoded in a segment's path."""
+    return int(os.path.basename(base)[8:]) / 1000
@@ -0,0 +1,45 @@
+import cv2
+import numpy as np
+
+
+def draw_counts(frame, total_spaces, free_spaces):
+    """Draw the total and free space counts on the frame."""
+    cv2.putText(frame,
+                f'Total space : {total_spaces}',
+                (50, 50),
+                cv2.FONT_HERSHEY_SIMPLEX, 1,
+                (8, 210, 255),
+                2,
+                cv2.LINE_4)
+
+    cv2.putText(frame,
+                f'Free space : {free_spaces}',
+                (50, 100),
+                cv2.FONT_HERSHEY_SIMPLEX, 1,
+                (8, 210, 90),
+                3,
+                cv2.LINE_4)
+
+
+def draw_occupancy(frame, layout, occupied, masks=None):
+    """Tint occupied spaces red and free spaces yellow, in place.
+
+    `masks` is an optional pair of frame-sized buffers reused between calls.
+    """
+    if masks is None:
+        mask_1 = np.zeros_like(frame)
+        mask_2 = np.zeros_like(frame)
+    else:
+        mask_1, mask_2 = masks
+        mask_1.fill(0)
+        mask_2.fill(0)
+
+    for polygon, is_present in zip(layout.arrays, occupied):
+        if is_present:
+            cv2.fillPoly(mask_1, [polygon], (0, 0, 255))
+        else:
+            cv2.fillPoly(mask_2, [polygon], (0, 255, 255))
+
+    cv2.addWeighted(mask_1, 0.2, frame, 1, 0, dst=frame)
+    cv2.addWeighted(mask_2, 0.2, frame, 1, 0, dst=frame)
+    return frame
@@ -0,0 +1,125 @@
+"""Renditions of a camera stream for viewers on different links.
+
+The producer's JPEG is the "full" rendition and is passed through as is.
+Smaller renditions are made on demand: the first viewer that needs one for a
+new frame decodes the JPEG (at a reduced scale when possible), resizes and
+encodes it, and every other viewer of that rendition reuses the result. The
+encode cost is at most one encode per rendition per frame, however many
+viewers there are.
+
+Viewers pick a rendition with `?rendition=` or leave it to AdaptiveRendition,
+which steps down when writing frames to the viewer falls behind and back up
+once it keeps up.
+"""
+
+import collections
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from upstream import build_part
+
+Rendition = collections.namedtuple("Rendition", "name width quality fps")
+
+# Best first; width None means the producer's own frame
+RENDITIONS = collections.OrderedDict((r.name, r) for r in (
+    Rendition("full", None, None, 25),
+    Rendition("medium", 640, 60, 12),
+    Rendition("low", 320, 50, 4),
+))
+# Step down when writes take this fraction of the frame interval, on average
+STEP_DOWN_LOAD = 0.7
+# Step up after this many frames written in under STEP_UP_LOAD of the interval
+STEP_UP_LOAD = 0.2
+STEP_UP_FRAMES = 50
+
+# JPEG decoding can scale by 1/2, 1/4 or 1/8 for almost free
+_REDUCED = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+            (2, cv2.IMREAD_REDUCED_COLOR_2), (1, cv2.IMREAD_COLOR))
+
+
+class RenditionCache:
+    """The latest encoded part of every rendition of one camera."""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.locks = {name: threading.Lock() for name in RENDITIONS}
+        self.parts = {}  # name -> (seq, part)
+        self.source_width = None
+
+    def part(self, frame, rendition):
+        """Return the multipart part of `frame` in `rendition`, encoding it at most once."""
+        seq, capture_ts, jpeg, part = frame
+        if rendition.width is None:
+            return part
+        cached = self.parts.get(rendition.name)
+        if cached is not None and cached[0] == seq:
+            return cached[1]
+
+        with self.locks[rendition.name]:
+            # Another viewer may have encoded it while we waited
+            cached = self.parts.get(rendition.name)
+            if cached is not None and cached[0] == seq:
+                return cached[1]
+            start = time.perf_counter()
+            image = self._decode(jpeg, rendition.width)
+            if image.shape[1] > rendition.width:
+                height = max(1, round(image.shape[0] * rendition.width / image.shape[1]))
+                image = cv2.resize(image, (rendition.width, height), interpolation=cv2.INTER_AREA)
+            _, encoded = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), rendition.quality])
+            rendered = build_part(encoded.tobytes(), seq, capture_ts)
+            self.parts[rendition.name] = (seq, rendered)
+            self.metrics.observe('rendition_encode', time.perf_counter() - start)
+            self.metrics.inc('renditions_encoded_total')
+            return rendered
+
+    def _decode(self, jpeg, width):
+        scale, flag = 1, cv2.IMREAD_COLOR
+        if self.source_width:
+            # The largest reduction that still leaves enough pixels
+            scale, flag = next(((s, f) for s, f in _REDUCED if self.source_width // s >= width),
+                               (1, cv2.IMREAD_COLOR))
+        image = cv2.imdecode(np.frombuffer(jpeg, np.uint8), flag)
+        if image is None:
+            raise ValueError("Cannot decode frame")
+        self.source_width = image.shape[1] * scale
+        return image
+
+
+class AdaptiveRendition:
+    """Chooses the rendition of one viewer.
+
+    With `adaptive` the choice follows how long each frame takes to be
+    written to the viewer, relative to the rendition's frame interval.
+    """
+
+    def __init__(self, name="full", adaptive=True):
+        self.ladder = list(RENDITIONS)
+        self.level = self.ladder.index(name)
+        self.adaptive = adaptive
+        self.load = 0.0
+        self.good = 0
+
+    def current(self):
+        return RENDITIONS[self.ladder[self.level]]
+
+    def observe(self, write_seconds):
+        """Record how long writing the last frame took."""
+        if not self.adaptive:
+            return
+        load = write_seconds * self.current().fps
+        self.load = 0.8 * self.load + 0.2 * load
+        if self.load > STEP_DOWN_LOAD and self.level < len(self.ladder) - 1:
+            self.level += 1
+            self.load = 0.0
+            self.good = 0
+        elif load < STEP_UP_LOAD:
+            self.good += 1
+            if self.good >= STEP_UP_FRAMES and self.level > 0:
+                self.level -= 1
+                self.load = 0.0
+                self.good = 0
+        else:
+            self.good = 0
@@ -1,170 +1,367 @@
 # Updated server.py to receive and display streams from main.py
 
-from flask import Flask, Response, render_template, jsonify
+from flask import Flask, Response, abort, render_template, jsonify, request
 import cv2
 import numpy as np
 import threading
 import time
-import socket
-import pickle
-import struct
-import io
+from metrics import Metrics, RollingWindow, render_prometheus_series
+from groups import space_stats
+from upstream import Camera, UpstreamLoop, build_part, load_upstreams
+from renditions import RENDITIONS, AdaptiveRendition, RenditionCache
 
 app = Flask(__name__)
 
 # Global variables
-frame_buffer = None
-parking_stats = {
-    'total_spaces': 0,
-    'free_spaces': 0,
-    'occupied_spaces': 0,
-    'occupancy_rate': 0
-}
+# Every upstream camera by name; the first one is served by the routes without a camera
+cameras = {}
+rendition_caches = {}  # Encoded renditions of every camera, shared by its viewers
 stream_thread = None
 streaming_active = False
-client_connected = False
+# Seconds from capture to each point of the pipeline; producer, server and
+# browser clocks are assumed to be synchronized (NTP)
+latency = {
+    'capture_to_server': RollingWindow(),
+    'capture_to_viewer': RollingWindow(),
+    'capture_to_browser': RollingWindow(),
+}
+metrics = Metrics()
+viewers_lock = threading.Lock()
+viewers = 0
 
-# Configuration options
+# Configuration options; config/upstreams.json lists several producers instead
 STREAMING_HOST = '192.168.137.1'
 STREAMING_PORT = 9999
-JPEG_QUALITY = 70
+SERVER_PORT = 3000
+# The server is ready while the producer sent a frame this recently
+READY_TIMEOUT = 5.0
+# Snapshots may be reused this long by clients and caches, then revalidated with If-None-Match
+SNAPSHOT_MAX_AGE = 1
+# Replay speeds outside this range are clamped
+REPLAY_SPEED_MIN = 0.1
+REPLAY_SPEED_MAX = 100.0
+
+def get_camera(name=None):
+    """Return a camera by name, the first camera without one, or None"""
+    if name is None:
+        return next(iter(cameras.values()), None)
+    return cameras.get(name)
 
 def receive_stream():
-    """Receive processed frames and stats from main.py"""
-    global frame_buffer, parking_stats, client_connected
-    
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    
-    while True:
-        try:
-            # Connect to the main.py stream server
-            print("Attempting to connect to main.py stream...")
-            client_socket.connect((STREAMING_HOST, STREAMING_PORT))
-            client_connected = True
-            print("Connected to main.py stream server")
-            
-            data = b""
-            payload_size = struct.calcsize("L")
-            
-            while True:
-                # Receive message size
-                while len(data) < payload_size:
-                    packet = client_socket.recv(4096)
-                    if not packet:
-                        raise ConnectionError("Connection closed")
-                    data += packet
-                
-                # Extract message size
-                packed_msg_size = data[:payload_size]
-                data = data[payload_size:]
-                msg_size = struct.unpack("L", packed_msg_size)[0]
-                
-                # Receive full message data
-                while len(data) < msg_size:
-                    packet = client_socket.recv(4096)
-                    if not packet:
-                        raise ConnectionError("Connection closed")
-                    data += packet
-                
-                # Extract frame and stats data
-                frame_data = data[:msg_size]
-                data = data[msg_size:]
-                
-                # Deserialize the data
-                received_data = pickle.loads(frame_data)
-                
-                # Update frame buffer and stats
-                encoded_frame = received_data['frame']
-                nparr = np.frombuffer(encoded_frame, np.uint8)
-                frame_buffer = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                
-                # Update stats
-                parking_stats = received_data['stats']
-        
-        except (ConnectionRefusedError, ConnectionError) as e:
-            print(f"Stream connection error: {e}")
-            client_connected = False
-            
-            # Wait before attempting to reconnect
-            time.sleep(5)
-            
-        except Exception as e:
-            print(f"Unexpected error in stream: {e}")
-            client_connected = False
-            
-            # Wait before attempting to reconnect
-            time.sleep(5)
+    """Receive processed frames and stats from every main.py producer"""
+    UpstreamLoop(list(cameras.values()), metrics).run()
 
-def generate_frames():
-    """Generate frames for the web client"""
-    global frame_buffer, streaming_active
+def generate_frames(camera, choice):
+    """Generate frames for the web client in the rendition picked by choice"""
+    global streaming_active, viewers
     
     streaming_active = True
-    last_frame_time = time.time()
     
+    with viewers_lock:
+        viewers += 1
+        metrics.set_gauge('viewers', viewers)
+    try:
+        yield from _viewer_frames(camera, choice)
+    finally:
+        with viewers_lock:
+            viewers -= 1
+            metrics.set_gauge('viewers', viewers)
+
+def _viewer_frames(camera, choice):
+    """Frames of one /video_feed viewer"""
+    global streaming_active
+    
+    cache = rendition_caches[camera.name]
+    sent = None  # Last frame sent
+    next_due = time.monotonic()
     while streaming_active:
-        current_time = time.time()
-        if current_time - last_frame_time < 0.04:  # ~25 FPS
-            time.sleep(0.005)  # Small sleep to reduce CPU usage
+        # Woken by the next frame instead of polling for it
+        frame = camera.wait_frame(sent, 0.5)
+        if frame is None:
+            if camera.frame is None:
+                # If no frame is available, yield a simple blank frame with status
+                blank_frame = np.zeros((540, 960, 3), dtype=np.uint8)
+                
+                # Add text about connection status
+                status_text = "Connecting to main.py stream..." if not camera.connected else "Waiting for video..."
+                cv2.putText(blank_frame, status_text, (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+                
+                _, buffer = cv2.imencode('.jpg', blank_frame)
+                yield build_part(buffer.tobytes(), None, None)
             continue
-            
-        if frame_buffer is not None:
-            # Encode the frame as JPEG
-            encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY]
-            _, buffer = cv2.imencode('.jpg', frame_buffer, encode_params)
-            frame_bytes = buffer.tobytes()
-            
-            # Yield the frame in the format required by HTTP streaming
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                   
-            last_frame_time = current_time
-        else:
-            # If no frame is available, yield a simple blank frame with status
-            blank_frame = np.zeros((540, 960, 3), dtype=np.uint8)
-            
-            # Add text about connection status
-            status_text = "Connecting to main.py stream..." if not client_connected else "Waiting for video..."
-            cv2.putText(blank_frame, status_text, (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-            
-            _, buffer = cv2.imencode('.jpg', blank_frame)
-            frame_bytes = buffer.tobytes()
-            
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-            
-            time.sleep(0.5)  # Longer sleep when no frame is available
+        
+        rendition = choice.current()
+        now = time.monotonic()
+        if now < next_due:
+            # The rendition's rate is below the source's: hold until due, then send the newest frame
+            time.sleep(next_due - now)
+            frame = camera.frame
+        
+        # Viewers of a rendition yield the same part, encoded once per frame
+        part = cache.part(frame, rendition)
+        metrics.inc('frames_served_total')
+        start = time.monotonic()
+        yield part
+        
+        # The generator resumes once the previous part has been written out,
+        # so a slow write means the viewer's connection is falling behind
+        choice.observe(time.monotonic() - start)
+        capture_ts = frame[1]
+        if capture_ts is not None:
+            latency['capture_to_viewer'].add(time.time() - capture_ts)
+        sent = frame
+        
+        # Paced against a deadline, so jitter in the source costs no frames and
+        # a stall is followed by at most one frame early, not a burst
+        interval = 1 / rendition.fps
+        next_due = max(next_due + interval, time.monotonic() - interval)
     
     # Reset flag when client disconnects
     streaming_active = False
 
+def camera_or_404(name):
+    """Return the named camera, or abort with a JSON 404"""
+    camera = get_camera(name)
+    if camera is None:
+        response = jsonify({'error': f'unknown camera {name}'})
+        response.status_code = 404
+        abort(response)
+    return camera
+
+def frame_stats(camera, stats):
+    """Stats with the frame they belong to"""
+    return dict(stats, camera=camera.name, seq=camera.seq, capture_ts=camera.capture_ts,
+                server_ts=time.time())
+
 @app.route('/')
 def index():
     """Serve the main page"""
     return render_template('index.html')
 
 @app.route('/video_feed')
-def video_feed():
-    """Video streaming route"""
-    return Response(generate_frames(),
+@app.route('/video_feed/<cam>')
+def video_feed(cam=None):
+    """Video streaming route; ?rendition=full|medium|low, adaptive by default"""
+    camera = camera_or_404(cam)
+    name = request.args.get('rendition', 'auto')
+    if name == 'auto':
+        choice = AdaptiveRendition()
+    elif name in RENDITIONS:
+        choice = AdaptiveRendition(name, adaptive=False)
+    else:
+        return jsonify({'error': f'unknown rendition {name}', 'renditions': list(RENDITIONS)}), 400
+    return Response(generate_frames(camera, choice),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
+def frame_etag(camera, seq):
+    """ETag of everything derived from one producer frame"""
+    return f'{camera.name}-{camera.connects}-{seq}'
+
+def conditional(etag, build, mimetype):
+    """304 when the client already has `etag`, else the response `build()` returns"""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(build(), mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={SNAPSHOT_MAX_AGE}'
+    return response
+
+@app.route('/snapshot.jpg')
+@app.route('/snapshot/<cam>.jpg')
+def snapshot(cam=None):
+    """The latest frame as a JPEG, as the producer encoded it"""
+    camera = camera_or_404(cam)
+    frame = camera.frame
+    if frame is None:
+        return jsonify({'error': 'no frame received yet'}), 503
+    seq, capture_ts, jpeg, part = frame
+    response = conditional(frame_etag(camera, seq), lambda: jpeg, 'image/jpeg')
+    response.headers['X-Frame-Seq'] = str(seq)
+    if capture_ts is not None:
+        response.headers['X-Capture-Timestamp'] = f'{capture_ts:.6f}'
+    return response
+
+@app.route('/state')
+@app.route('/state/<cam>')
+def state(cam=None):
+    """Stats and group counts of the latest frame, revalidated like /snapshot.jpg"""
+    camera = camera_or_404(cam)
+    if camera.state is None:
+        return jsonify({'error': 'no frame received yet'}), 503
+    seq, capture_ts, stats, groups = camera.state
+    return conditional(frame_etag(camera, seq),
+                       lambda: jsonify(dict(stats, groups=groups, camera=camera.name, seq=seq,
+                                            capture_ts=capture_ts)).get_data(),
+                       'application/json')
+
 @app.route('/stats')
-def get_stats():
-    """Return parking statistics as JSON"""
-    return jsonify(parking_stats)
+@app.route('/stats/<cam>')
+def get_stats(cam=None):
+    """Return parking statistics as JSON, with the frame they belong to; ?group= selects a space group"""
+    camera = camera_or_404(cam)
+    stats = camera.stats
+    group = request.args.get('group')
+    if group is not None:
+        stats = camera.groups.get(group)
+        if stats is None:
+            return jsonify({'error': f'unknown group {group}'}), 404
+        stats = dict(stats, group=group)
+    return jsonify(frame_stats(camera, stats))
+
+@app.route('/groups')
+@app.route('/groups/<cam>')
+def get_groups(cam=None):
+    """Return the counts of every space group"""
+    return jsonify(camera_or_404(cam).groups)
+
+def site_stats():
+    """Lot and group counts summed over every camera"""
+    total = occupied = 0
+    groups = {}
+    for camera in cameras.values():
+        total += camera.stats['total_spaces']
+        occupied += camera.stats['occupied_spaces']
+        for name, stats in camera.groups.items():
+            counts = groups.setdefault(name, [0, 0])
+            counts[0] += stats['total_spaces']
+            counts[1] += stats['occupied_spaces']
+    return space_stats(total, occupied), {name: space_stats(*counts) for name, counts in groups.items()}
+
+@app.route('/site')
+def get_site():
+    """Site-wide stats over every camera, with each camera's own; ?group= selects a space group"""
+    stats, groups = site_stats()
+    group = request.args.get('group')
+    if group is not None:
+        if group not in groups:
+            return jsonify({'error': f'unknown group {group}'}), 404
+        return jsonify(dict(groups[group], group=group, server_ts=time.time()))
+    return jsonify(dict(stats, groups=groups, server_ts=time.time(), cameras={
+        camera.name: dict(camera.stats, connected=camera.connected,
+                          ready=camera.is_ready(READY_TIMEOUT), seq=camera.seq)
+        for camera in cameras.values()}))
+
+@app.route('/latency', methods=['GET', 'POST'])
+def get_latency():
+    """Rolling latency stats; browsers POST the delay they measured"""
+    if request.method == 'POST':
+        delay_ms = (request.get_json(silent=True) or {}).get('delay_ms')
+        if isinstance(delay_ms, (int, float)) and 0 <= delay_ms < 600000:
+            latency['capture_to_browser'].add(delay_ms / 1000)
+        return ('', 204)
+    return jsonify({name: window.summary() for name, window in latency.items()})
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus metrics of this server and of the producers, labelled by camera"""
+    # Receive and write state of each camera, labelled by camera
+    receiving = [({'camera': camera.name}, {'stages': {},
+                                            'counters': {f'{stage}_dropped_total': dropped
+                                                         for stage, dropped in camera.write_dropped.items()},
+                                            'gauges': {'receive_backlog_bytes': camera.receive_backlog_bytes,
+                                                       'write_queue': camera.writes.qsize()}})
+                 for camera in cameras.values()]
+    text = render_prometheus_series([({}, metrics.snapshot())] + receiving, 'parking_server')
+    producers = [({'camera': camera.name}, camera.producer_metrics)
+                 for camera in cameras.values() if camera.producer_metrics is not None]
+    if producers:
+        text += render_prometheus_series(producers, 'parking_producer')
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+@app.route('/ready')
+@app.route('/ready/<cam>')
+def ready(cam=None):
+    """Readiness probe: 200 only while the producer is delivering frames"""
+    if cam is None and len(cameras) > 1:
+        # A site node is ready while any of its cameras delivers frames
+        states = {camera.name: camera.is_ready(READY_TIMEOUT) for camera in cameras.values()}
+        is_ready = any(states.values())
+        return jsonify({'ready': is_ready, 'cameras': states}), 200 if is_ready else 503
+    is_ready = camera_or_404(cam).is_ready(READY_TIMEOUT)
+    return jsonify({'ready': is_ready}), 200 if is_ready else 503
+
+@app.route('/history')
+def get_history():
+    """Return occupancy history downsampled to min/max/mean per bucket; ?camera= selects a camera"""
+    history = camera_or_404(request.args.get('camera')).history
+    end = request.args.get('end', time.time(), type=float)
+    start = request.args.get('start', end - 24 * 3600, type=float)
+    buckets = min(max(request.args.get('buckets', 200, type=int), 1), 5000)
+    return jsonify(history.aggregates(start, end, buckets))
+
+@app.route('/history/transitions')
+def get_history_transitions():
+    """Return per-space occupancy transitions; ?camera= selects a camera"""
+    history = camera_or_404(request.args.get('camera')).history
+    end = request.args.get('end', time.time(), type=float)
+    start = request.args.get('start', end - 3600, type=float)
+    space = request.args.get('space', None, type=int)
+    limit = min(max(request.args.get('limit', 1000, type=int), 1), 100000)
+    return jsonify(history.transitions(start, end, space, limit))
+
+def replay_frames(recorder, start, speed):
+    """Recorded frames from `start` on, paced by their capture times divided by `speed`"""
+    first_ts = started = None
+    for ts, meta, spaces, jpeg in recorder.frames(start):
+        if first_ts is None:
+            first_ts, started = ts, time.monotonic()
+        delay = (ts - first_ts) / speed - (time.monotonic() - started)
+        if delay > 0:
+            time.sleep(delay)
+        yield build_part(jpeg, meta.get('seq'), ts)
+
+def replay_start():
+    """Replay time from ?t=, seconds since the epoch or, when negative, before now"""
+    t = request.args.get('t', type=float)
+    if t is None:
+        response = jsonify({'error': 't is required'})
+        response.status_code = 400
+        abort(response)
+    return time.time() + t if t < 0 else t
+
+@app.route('/replay')
+@app.route('/replay/<cam>')
+def replay(cam=None):
+    """Stream the recording from ?t= on at ?speed= times real time, without re-running inference"""
+    recorder = camera_or_404(cam).recorder
+    start = replay_start()
+    speed = min(max(request.args.get('speed', 1.0, type=float), REPLAY_SPEED_MIN), REPLAY_SPEED_MAX)
+    if recorder.locate(start) is None:
+        return jsonify({'error': 'nothing recorded at or after t', 't': start}), 404
+    return Response(replay_frames(recorder, start, speed),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/replay/state')
+def replay_state():
+    """Stats and per-space states recorded at ?t=; ?camera= selects a camera"""
+    recorder = camera_or_404(request.args.get('camera')).recorder
+    start = replay_start()
+    state = recorder.state_at(start)
+    if state is None:
+        return jsonify({'error': 'nothing recorded at or before t', 't': start}), 404
+    ts, meta, spaces = state
+    total = meta['stats']['total_spaces']
+    occupied = np.unpackbits(np.frombuffer(spaces, np.uint8), count=total).astype(bool).tolist() if spaces else None
+    return jsonify(dict(meta['stats'], seq=meta.get('seq'), capture_ts=ts, spaces=occupied))
 
 @app.route('/connection_status')
 def connection_status():
-    """Return connection status to main.py stream"""
+    """Return connection status to the main.py streams"""
+    camera = get_camera()
     return jsonify({
-        'connected': client_connected
+        'connected': camera is not None and camera.connected,
+        'cameras': {camera.name: camera.connected for camera in cameras.values()}
     })
 
 def create_templates():
-    """Create the necessary templates folder and HTML files"""
+    """Create the necessary templates folder and HTML files if they are missing"""
     import os
     
+    # Keep an existing page instead of rewriting it on every start
+    if os.path.exists('templates/index.html'):
+        return
+    
     # Create templates directory if it doesn't exist
     os.makedirs('templates', exist_ok=True)
     
@@ -238,6 +435,9 @@ def create_templates():
         .rate {
             color: #6610f2;
         }
+        .delay {
+            color: #fd7e14;
+        }
         .controls {
             text-align: center;
             margin-top: 15px;
@@ -283,7 +483,7 @@ def create_templates():
         <h1>Parking Space Monitor</h1>
         
         <div class="video-container">
-            <img id="video-feed" src="{{ url_for('video_feed') }}" class="video-feed" alt="Parking Video Feed" onerror="handleVideoError()">
+            <img id="video-feed" class="video-feed" alt="Parking Video Feed">
             <div id="connection-status" class="connected">Connected to Server</div>
             <div id="stream-status" class="disconnected">Connecting to Stream...</div>
         </div>
@@ -305,6 +505,10 @@ def create_templates():
                 <h3>Occupancy Rate</h3>
                 <div class="stat-value rate" id="occupancy-rate">-</div>
             </div>
+            <div class="stat-box">
+                <h3>Delay</h3>
+                <div class="stat-value delay" id="latency">-</div>
+            </div>
         </div>
         
         <div class="controls">
@@ -322,8 +526,16 @@ def create_templates():
         let retryCount = 0;
         const maxRetries = 3;
         
+        // Server clock minus browser clock in ms, from the /stats round trip
+        let clockOffset = null;
+        let lastLatencyReport = 0;
+        const latencyReportInterval = 1500;
+        let streamController = null;
+        let frameUrl = null;
+        
         // Function to update the statistics
         function updateStats() {
+            const requestStart = Date.now();
             fetch('/stats')
                 .then(response => {
                     if (response.ok) {
@@ -336,6 +548,7 @@ def create_templates():
                     document.getElementById('free-spaces').textContent = data.free_spaces;
                     document.getElementById('occupied-spaces').textContent = data.occupied_spaces;
                     document.getElementById('occupancy-rate').textContent = data.occupancy_rate + '%';
+                    updateClockOffset(data, requestStart);
                     
                     // Reset connection status if it was previously lost
                     if (connectionLost) {
@@ -367,12 +580,131 @@ def create_templates():
                 });
         }
         
+        // Function to estimate the offset between the browser and server clocks
+        function updateClockOffset(data, requestStart) {
+            const now = Date.now();
+            clockOffset = data.server_ts * 1000 - (requestStart + now) / 2;
+        }
+        
+        // Function to show and report the delay between capture and display of a frame
+        function updateLatency(captureTs) {
+            if (clockOffset === null || isNaN(captureTs)) {
+                return;
+            }
+            const now = Date.now();
+            const delay = Math.max(0, now + clockOffset - captureTs * 1000);
+            document.getElementById('latency').textContent = Math.round(delay) + ' ms';
+            
+            if (now - lastLatencyReport < latencyReportInterval) {
+                return;
+            }
+            lastLatencyReport = now;
+            fetch('/latency', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({delay_ms: delay})
+            }).catch(error => console.error('Error reporting latency:', error));
+        }
+        
+        // Function to find a byte sequence in a buffer
+        function indexOfBytes(buffer, bytes) {
+            for (let i = 0; i + bytes.length <= buffer.length; i++) {
+                let j = 0;
+                while (j < bytes.length && buffer[i + j] === bytes[j]) {
+                    j++;
+                }
+                if (j === bytes.length) {
+                    return i;
+                }
+            }
+            return -1;
+        }
+        
+        // Function to split the multipart video stream into its parts: headers, a blank
+        // line, then Content-Length bytes of JPEG
+        async function readParts(reader, onPart) {
+            const headerEnd = [13, 10, 13, 10];
+            const decoder = new TextDecoder();
+            let buffer = new Uint8Array(0);
+            while (true) {
+                const end = indexOfBytes(buffer, headerEnd);
+                if (end >= 0) {
+                    const headers = {};
+                    for (const line of decoder.decode(buffer.subarray(0, end)).split(String.fromCharCode(10))) {
+                        const colon = line.indexOf(':');
+                        if (colon > 0) {
+                            headers[line.slice(0, colon).trim().toLowerCase()] = line.slice(colon + 1).trim();
+                        }
+                    }
+                    const length = parseInt(headers['content-length']);
+                    if (isNaN(length)) {
+                        throw new Error('Video part without Content-Length');
+                    }
+                    const start = end + headerEnd.length;
+                    if (buffer.length >= start + length) {
+                        onPart(headers, buffer.slice(start, start + length));
+                        buffer = buffer.subarray(start + length);
+                        continue;
+                    }
+                }
+                const {done, value} = await reader.read();
+                if (done) {
+                    throw new Error('Video stream ended');
+                }
+                const joined = new Uint8Array(buffer.length + value.length);
+                joined.set(buffer);
+                joined.set(value, buffer.length);
+                buffer = joined;
+            }
+        }
+        
+        // Function to show a frame of the stream, and its delay once it is displayed
+        function showFrame(headers, jpeg) {
+            const videoFeed = document.getElementById('video-feed');
+            const captureTs = parseFloat(headers['x-capture-timestamp']);
+            if (frameUrl) {
+                URL.revokeObjectURL(frameUrl);
+            }
+            frameUrl = URL.createObjectURL(new Blob([jpeg], {type: 'image/jpeg'}));
+            videoFeed.onload = () => updateLatency(captureTs);
+            videoFeed.src = frameUrl;
+            retryCount = 0;
+        }
+        
+        // Function to read the video stream, so the capture time of every frame is known
+        function startStream() {
+            stopStream();
+            const controller = new AbortController();
+            streamController = controller;
+            fetch("{{ url_for('video_feed') }}", {signal: controller.signal, cache: 'no-store'})
+                .then(response => {
+                    if (!response.ok || !response.body) {
+                        throw new Error('Network response was not ok');
+                    }
+                    return readParts(response.body.getReader(), showFrame);
+                })
+                .catch(error => {
+                    if (!controller.signal.aborted) {
+                        console.error('Error reading video stream:', error);
+                        handleVideoError();
+                    }
+                });
+        }
+        
+        // Function to stop reading the video stream
+        function stopStream() {
+            if (streamController) {
+                streamController.abort();
+                streamController = null;
+            }
+        }
+        
         // Function to handle video errors
         function handleVideoError() {
             retryCount++;
             if (retryCount <= maxRetries) {
                 console.log(`Stream error, attempting reconnect (${retryCount}/${maxRetries})...`);
-                setTimeout(refreshStream, 2000);
+                setTimeout(startStream, 2000);
             } else {
                 updateConnectionStatus(false);
                 console.error('Failed to reconnect to video stream after multiple attempts');
@@ -381,9 +713,8 @@ def create_templates():
         
         // Function to refresh the video stream
         function refreshStream() {
-            const videoFeed = document.getElementById('video-feed');
-            videoFeed.src = "{{ url_for('video_feed') }}?" + new Date().getTime(); // Add cache-busting parameter
             retryCount = 0;
+            startStream();
             updateConnectionStatus(true);
         }
         
@@ -399,7 +730,8 @@ def create_templates():
             }
         }
 
-        // Update stats initially and then every 1.5 seconds
+        // Start the stream, update stats initially and then every 1.5 seconds
+        startStream();
         updateStats();
         setInterval(updateStats, 1500);
         
@@ -409,6 +741,7 @@ def create_templates():
             if (document.hidden) {
                 // Page is hidden, pause video stream to save resources
                 videoFeed.style.display = 'none';
+                stopStream();
             } else {
                 // Page is visible again, resume video stream
                 videoFeed.style.display = 'block';
@@ -427,13 +760,16 @@ def start_server():
     # Create the necessary template files
     create_templates()
     
-    # Start the stream receiving thread
+    # One camera per upstream producer, all received by a single thread
+    for name, (host, port) in load_upstreams(STREAMING_HOST, STREAMING_PORT).items():
+        cameras[name] = Camera(name, host, port, metrics, latency)
+        rendition_caches[name] = RenditionCache(metrics)
     stream_thread = threading.Thread(target=receive_stream)
     stream_thread.daemon = True
     stream_thread.start()
     
     # Run the Flask app with optimized settings
-    app.run(host='0.0.0.0', port=3000, debug=False, threaded=True)
+    app.run(host='0.0.0.0', port=SERVER_PORT, debug=False, threaded=True)
 
 if __name__ == '__main__':
-    start_server()
\ No newline at end of file
+    start_server()
@@ -0,0 +1,35 @@
+"""Long editor operations, run off the UI thread.
+
+The editor starts a BackgroundTask and keeps drawing frames while it runs,
+showing `status()`; once `done` it applies `result` on its own thread.
+"""
+
+import threading
+import time
+
+
+class BackgroundTask:
+    """Runs `fn(task, *args)` on a thread; `fn` may set `task.progress` from 0 to 1."""
+
+    def __init__(self, name, fn, *args):
+        self.name = name
+        self.progress = None  # Unknown until fn reports it
+        self.result = None
+        self.error = None
+        self.done = False
+        self.started = time.monotonic()
+        threading.Thread(target=self._run, args=(fn, args), daemon=True).start()
+
+    def _run(self, fn, args):
+        try:
+            self.result = fn(self, *args)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+
+    def status(self):
+        """Text for the overlay: the progress, or the time spent when it is unknown."""
+        if self.progress is None:
+            return f"{self.name}... {time.monotonic() - self.started:.0f}s"
+        return f"{self.name}... {self.progress:.0%}"
@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+import control
+import layout_store
+from control import RuntimeControl
+from layout_store import get_writer, layout_path, load_layout
+
+SQUARES = [[(x, 0), (x + 10, 0), (x + 10, 10), (x, 10)] for x in (0, 20, 40)]
+
+
+class Editor(threading.Thread):
+    """Applies layout changes like main1.py's editor and saves its own state after every redraw."""
+
+    def __init__(self, runtime, polygon_data, meta):
+        super().__init__(daemon=True)
+        self.runtime = runtime
+        self.polygon_data = polygon_data
+        self.meta = meta
+        self.running = True
+
+    def run(self):
+        writer = get_writer(self.runtime.camera)
+        while self.running:
+            # An edit such as a drag saves whatever the editor holds, also while a change is posted
+            writer.save(self.polygon_data, self.meta)
+            pending = self.runtime.take_pending(('layout_change',))
+            if 'layout_change' in pending:
+                changed = pending['layout_change'].apply(list(self.polygon_data), dict(self.meta))
+                if changed is not None:
+                    self.polygon_data, self.meta, _ = changed
+            time.sleep(0.001)
+
+
+@pytest.fixture
+def runtime(tmp_path, monkeypatch):
+    # An absolute path: the writer thread may still save once the test is over
+    monkeypatch.setattr(layout_store, "LAYOUT_DIR", str(tmp_path / "object"))
+    return RuntimeControl(f"cam-{tmp_path.name}", {})
+
+
+def test_update_survives_editor_saves(runtime):
+    writer = get_writer(runtime.camera)
+    writer.save(SQUARES, {})
+    writer.flush()
+    editor = Editor(runtime, SQUARES, {})
+    editor.start()
+    try:
+        assert runtime.update_spaces([1], {'threshold': 0.7}) == 1
+        # Saves of the state from before the update were made right up to it; the later ones carry it
+        time.sleep(0.01)
+    finally:
+        editor.running = False
+        editor.join()
+    writer.flush()
+    polygon_data, meta = load_layout(layout_path(runtime.camera))
+    assert polygon_data == SQUARES
+    assert meta['spaces'] == [{}, {'threshold': 0.7}, {}]
+
+
+def test_bad_update_changes_nothing(runtime):
+    editor = Editor(runtime, SQUARES, {'spaces': [{'threshold': 0.5}]})
+    editor.start()
+    try:
+        with pytest.raises(ValueError):
+            runtime.update_spaces([5], {'threshold': 0.7})
+        with pytest.raises(ValueError):
+            runtime.update_spaces([0], {'threshold': "x"})
+        with pytest.raises(ValueError):
+            runtime.update_spaces([0], {'threshold': 1.5})
+    finally:
+        editor.running = False
+        editor.join()
+    assert editor.meta == {'spaces': [{'threshold': 0.5}]}
+
+
+def test_update_without_editor_times_out(runtime, monkeypatch):
+    monkeypatch.setattr(control, "LAYOUT_CHANGE_TIMEOUT", 0.05)
+    with pytest.raises(TimeoutError):
+        runtime.update_spaces([0], {'threshold': 0.7})
+    assert runtime.take_pending() == {}
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from groups import GroupCounters, expand_groups, space_stats
+from occupancy import compile_layout
+
+
+def layout(groups):
+    polygon_data = [[(i * 10, 0), (i * 10 + 8, 0), (i * 10 + 8, 8), (i * 10, 8)] for i in range(len(groups))]
+    return compile_layout(polygon_data, {'spaces': [{'groups': g} if g else {} for g in groups]})
+
+
+def brute_force(groups, occupied):
+    """Counts recomputed from scratch, to check the incremental ones against."""
+    counts = {}
+    for paths, state in zip(groups, occupied):
+        for name in expand_groups(paths or []):
+            total, busy = counts.get(name, (0, 0))
+            counts[name] = (total + 1, busy + int(state))
+    return {name: list(c) for name, c in counts.items()}
+
+
+def test_expand_groups():
+    assert expand_groups("P2/row B") == ["P2", "P2/row B"]
+    assert expand_groups(["P2/row B", "P2/ row C ", "type/ev"]) == ["P2", "P2/row B", "P2/row C", "type", "type/ev"]
+    assert expand_groups(["", "/"]) == []
+
+
+def test_counts_follow_transitions():
+    counters = GroupCounters(layout([["P1/row A"], ["P1/row A", "type/ev"], ["P1/row B"], None]))
+    assert counters.snapshot() == {'P1': [3, 0], 'P1/row A': [2, 0], 'type': [1, 0], 'type/ev': [1, 0],
+                                   'P1/row B': [1, 0]}
+    assert counters.lot() == space_stats(4, 0)
+
+    assert counters.update(np.array([False, True, True, True])) == 3
+    assert counters.snapshot() == {'P1': [3, 2], 'P1/row A': [2, 1], 'type': [1, 1], 'type/ev': [1, 1],
+                                   'P1/row B': [1, 1]}
+    assert counters.lot() == space_stats(4, 3)
+
+    # Freed and taken in the same frame
+    assert counters.update(np.array([True, False, True, True])) == 2
+    assert counters.group('P1/row A') == space_stats(2, 1)
+    assert counters.group('type/ev') == space_stats(1, 0)
+    assert counters.group('P9') is None
+
+
+def test_version_changes_only_with_the_counts():
+    counters = GroupCounters(layout([["A"], ["B"]]))
+    version = counters.version
+    assert counters.update(np.array([False, False])) == 0
+    assert counters.version == version
+    counters.update(np.array([True, False]))
+    assert counters.version > version
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_transitions_match_a_recount(seed):
+    rng = np.random.default_rng(seed)
+    names = ["P1/row A", "P1/row B", "P2/row A", "type/ev", "type/disabled"]
+    groups = [list(rng.choice(names, size=rng.integers(0, 3), replace=False)) for _ in range(200)]
+    counters = GroupCounters(layout(groups))
+    for _ in range(50):
+        occupied = rng.random(200) < rng.random()
+        counters.update(occupied)
+        assert counters.snapshot() == brute_force(groups, occupied)
+        assert counters.lot() == space_stats(200, int(occupied.sum()))
@@ -0,0 +1,82 @@
+import numpy as np
+
+from history import TRANSITION_DTYPE, HistoryStore, RecordRing
+
+
+def transitions(*timestamps):
+    records = np.zeros(len(timestamps), dtype=TRANSITION_DTYPE)
+    records['ts'] = timestamps
+    return records
+
+
+def test_ring_keeps_the_latest_records_in_order():
+    ring = RecordRing(TRANSITION_DTYPE, 4)
+    assert ring.oldest() is None
+    ring.append(transitions(0, 1, 2))
+    assert ring.records()['ts'].tolist() == [0, 1, 2]
+    ring.append(transitions(3, 4, 5))
+    assert ring.records()['ts'].tolist() == [2, 3, 4, 5]
+    assert ring.oldest() == 2
+
+
+def test_ring_append_larger_than_capacity():
+    ring = RecordRing(TRANSITION_DTYPE, 3)
+    ring.append(transitions(0))
+    ring.append(transitions(1, 2, 3, 4, 5))
+    assert ring.records()['ts'].tolist() == [3, 4, 5]
+    assert ring.oldest() == 3
+
+
+def test_aggregates_per_bucket(tmp_path):
+    store = HistoryStore(tmp_path, interval=60, flush_seconds=1e9)
+    for ts in range(0, 120):
+        store.record(ts, occupied_count=ts // 10, total_spaces=20)
+    # Nothing in [180, 240): that bucket stays empty
+    columns = store.aggregates(0, 240, 4)
+
+    assert columns['t'] == [0, 60, 120, 180]
+    assert columns['samples'] == [60, 60, 0, 0]
+    assert columns['min'] == [0, 6, None, None]
+    assert columns['max'] == [5, 11, None, None]
+    assert columns['mean'] == [2.5, 8.5, None, None]
+    assert columns['total'] == [20, 20, None, None]
+
+
+def test_aggregates_merge_intervals_into_buckets(tmp_path):
+    store = HistoryStore(tmp_path, interval=10, flush_seconds=1e9)
+    for ts, count in ((0, 4), (10, 2), (20, 8), (30, 6)):
+        store.record(ts, count, 10)
+    columns = store.aggregates(0, 40, 2)
+    assert columns['samples'] == [2, 2]
+    assert columns['min'] == [2, 6]
+    assert columns['max'] == [4, 8]
+    assert columns['mean'] == [3.0, 7.0]
+
+
+def test_transitions_log_changes_only(tmp_path):
+    store = HistoryStore(tmp_path, flush_seconds=1e9)
+    store.record(0, 1, 3, np.array([True, False, False]))
+    store.record(1, 1, 3, np.array([True, False, False]))
+    store.record(2, 2, 3, np.array([True, True, False]))
+    store.record(3, 1, 3, np.array([False, True, False]))
+
+    result = store.transitions(0, 10)
+    # The first frame logs every space
+    assert result['t'] == [0, 0, 0, 2, 3]
+    assert result['space'] == [0, 1, 2, 1, 0]
+    assert result['occupied'] == [True, False, False, True, False]
+    assert store.transitions(0, 10, space=1)['t'] == [0, 2]
+    assert store.transitions(0, 10, limit=2)['space'] == [1, 0]
+    assert store.transitions(1, 3)['t'] == [2]
+
+
+def test_history_is_read_back_from_disk(tmp_path):
+    store = HistoryStore(tmp_path, interval=10, flush_seconds=1e9)
+    for ts in range(0, 30):
+        store.record(ts, ts % 3, 5, np.arange(5) < ts % 3)
+    store.flush()
+
+    # A new store has empty rings, so queries go to the segment files
+    reopened = HistoryStore(tmp_path, interval=10, flush_seconds=1e9)
+    assert reopened.transitions(0, 30) == store.transitions(0, 30)
+    assert reopened.aggregates(0, 20, 2)['samples'] == [10, 10]
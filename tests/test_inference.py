@@ -0,0 +1,76 @@
+import os
+import sys
+import types
+
+import pytest
+
+import inference
+
+
+class FakeYOLO:
+    """Stands in for ultralytics.YOLO: counts loads and exports a small file."""
+
+    loads = 0
+    fail_export = False
+
+    def __init__(self, path):
+        FakeYOLO.loads += 1
+        self.path = path
+        self.overrides = {'imgsz': 320}
+
+    def export(self, format, imgsz):
+        if FakeYOLO.fail_export:
+            raise RuntimeError("export failed")
+        exported = f"{os.path.splitext(self.path)[0]}.{format}"
+        with open(exported, "w") as f:
+            f.write(f"{format} {imgsz}")
+        return exported
+
+
+@pytest.fixture
+def weights(tmp_path, monkeypatch):
+    monkeypatch.setattr(inference, "EXPORT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setitem(sys.modules, "ultralytics", types.SimpleNamespace(YOLO=FakeYOLO))
+    monkeypatch.setattr(FakeYOLO, "loads", 0)
+    monkeypatch.setattr(FakeYOLO, "fail_export", False)
+    path = tmp_path / "model.pt"
+    path.write_bytes(b"weights")
+    return str(path)
+
+
+def test_export_hit_does_not_load_weights(weights):
+    path, imgsz = inference.cached_export(weights, "onnx")
+    assert imgsz == 320
+    with open(path) as f:
+        assert f.read() == "onnx 320"
+    assert FakeYOLO.loads == 1
+
+    assert inference.cached_export(weights, "onnx") == (path, 320)
+    assert FakeYOLO.loads == 1
+
+
+def test_export_keyed_by_size(weights):
+    path, imgsz = inference.cached_export(weights, "onnx", 500)
+    assert imgsz == 512  # Rounded up to the stride
+    other, _ = inference.cached_export(weights, "onnx")
+    assert other != path
+    assert FakeYOLO.loads == 2
+
+
+def test_failed_export_is_not_cached(weights):
+    FakeYOLO.fail_export = True
+    with pytest.raises(RuntimeError):
+        inference.cached_export(weights, "onnx")
+    assert not os.path.exists(inference.EXPORT_CACHE_DIR)
+
+    FakeYOLO.fail_export = False
+    path, _ = inference.cached_export(weights, "onnx")
+    assert os.path.exists(path)
+
+
+def test_entry_without_marker_is_exported_again(weights):
+    path, _ = inference.cached_export(weights, "onnx")
+    os.remove(os.path.join(os.path.dirname(path), inference.EXPORT_MARKER))
+
+    assert inference.cached_export(weights, "onnx") == (path, 320)
+    assert FakeYOLO.loads == 2
@@ -0,0 +1,103 @@
+import struct
+
+import pytest
+
+from layout_store import HEADER, MAGIC, LayoutWriter, encode_layout, load_layout, save_layout
+
+POLYGONS = [
+    [(10, 20), (30, 20), (30, 60), (10, 60)],
+    [(100, 5), (140, 8), (138, 50)],
+    [(-3, 0), (2147483647, -2147483648), (7, 7), (0, 9), (1, 1)],
+]
+META = {'spaces': [{'threshold': 0.6}, {}, {'groups': ["P2/row B"]}], 'name': "Nord é"}
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "cam.layout")
+    save_layout(path, POLYGONS, META)
+    assert load_layout(path) == (POLYGONS, META)
+
+
+def test_round_trip_empty_layout(tmp_path):
+    path = str(tmp_path / "cam.layout")
+    save_layout(path, [])
+    assert load_layout(path) == ([], {})
+
+
+def test_save_replaces_the_file(tmp_path):
+    path = str(tmp_path / "cam.layout")
+    save_layout(path, POLYGONS, META)
+    save_layout(path, POLYGONS[:1])
+    assert load_layout(path) == (POLYGONS[:1], {})
+    assert [p.name for p in tmp_path.iterdir()] == ["cam.layout"]
+
+
+@pytest.mark.parametrize("size", [0, 1, HEADER.size - 1, HEADER.size, -1])
+def test_truncated_files_are_rejected(tmp_path, size):
+    data = encode_layout(POLYGONS, META)
+    path = write(tmp_path / "cam.layout", data[:size] if size >= 0 else data + b"\0")
+    with pytest.raises(ValueError):
+        load_layout(path)
+
+
+def test_wrong_magic_is_rejected(tmp_path):
+    data = encode_layout(POLYGONS, META)
+    path = write(tmp_path / "cam.layout", b"PKLX" + data[len(MAGIC):])
+    with pytest.raises(ValueError, match="not a layout file"):
+        load_layout(path)
+
+
+def test_newer_version_is_rejected(tmp_path):
+    data = bytearray(encode_layout(POLYGONS, META))
+    struct.pack_into("<H", data, len(MAGIC), 99)
+    path = write(tmp_path / "cam.layout", bytes(data))
+    with pytest.raises(ValueError, match="version 99"):
+        load_layout(path)
+
+
+def test_corrupt_offsets_are_rejected(tmp_path):
+    data = bytearray(encode_layout(POLYGONS, META))
+    # Second space starting after the last point
+    struct.pack_into("<I", data, HEADER.size + 4, 1000)
+    path = write(tmp_path / "cam.layout", bytes(data))
+    with pytest.raises(ValueError, match="corrupt"):
+        load_layout(path)
+
+
+def test_shrinking_offsets_are_rejected(tmp_path):
+    data = bytearray(encode_layout(POLYGONS, META))
+    struct.pack_into("<I", data, HEADER.size + 8, 2)
+    path = write(tmp_path / "cam.layout", bytes(data))
+    with pytest.raises(ValueError, match="corrupt"):
+        load_layout(path)
+
+
+def test_corrupt_metadata_is_rejected(tmp_path):
+    data = encode_layout(POLYGONS, META)
+    path = write(tmp_path / "cam.layout", data[:-1] + b"\xff")
+    with pytest.raises(ValueError):
+        load_layout(path)
+
+
+def test_writer_keeps_a_failed_snapshot_for_a_retry(tmp_path, monkeypatch):
+    import layout_store
+
+    def disk_full(*args):
+        raise OSError("disk full")
+
+    path = str(tmp_path / "cam.layout")
+    writer = LayoutWriter(path, delay=60, max_delay=60)
+    monkeypatch.setattr(layout_store, "save_layout", disk_full)
+    writer.save(POLYGONS, META)
+    assert not writer.flush()
+    assert writer.pending is not None and writer.retry_at > 0
+
+    monkeypatch.setattr(layout_store, "save_layout", save_layout)
+    assert writer.flush()
+    assert load_layout(path) == (POLYGONS, META)
+    assert writer.pending is None and writer.retry_at == 0
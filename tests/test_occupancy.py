@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from occupancy import compile_layout, detect_occupancy
+
+
+def layout(thresholds):
+    """One 10x10 space per threshold, side by side."""
+    polygon_data = [[(i * 20, 0), (i * 20 + 10, 0), (i * 20 + 10, 10), (i * 20, 10)] for i in range(len(thresholds))]
+    return compile_layout(polygon_data, {'spaces': [{} if t is None else {'threshold': t} for t in thresholds]})
+
+
+@pytest.mark.parametrize("value", ["0.5", True, 0, -0.2, 1.5, float("nan"), float("inf"), [0.5]])
+def test_bad_threshold_falls_back_to_default(value, capsys):
+    compiled = layout([value, 0.8])
+    assert np.isnan(compiled.thresholds[0])
+    assert compiled.thresholds[1] == 0.8
+    assert "space 0" in capsys.readouterr().out
+
+
+def test_space_thresholds_in_overlap_mode():
+    compiled = layout([None, 0.8, 1, "high"])
+    # Covers 60% of every space
+    boxes = np.array([[i * 20, 0, i * 20 + 6, 10] for i in range(4)], dtype=np.float32)
+    occupied = detect_occupancy(boxes, compiled, "overlap", 0.5)
+    assert occupied.tolist() == [True, False, False, True]
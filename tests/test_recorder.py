@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+from recorder import Recorder
+
+
+def jpeg(i):
+    return bytes([0xFF, 0xD8]) + i.to_bytes(4, "little") * (i + 1)
+
+
+@pytest.fixture
+def recorder(tmp_path):
+    """Frames at 100, 102, ..., 138 in segments of 10 seconds, with a gap from 118 to 130."""
+    recorder = Recorder(str(tmp_path), segment_seconds=10, max_fps=0)
+    for i, ts in enumerate(list(range(100, 120, 2)) + list(range(130, 140, 2))):
+        assert recorder.record(float(ts), {'seq': i, 'stats': {'free_spaces': i}}, bytes([i]), jpeg(i))
+    recorder.close()
+    return recorder
+
+
+def test_segments_split_by_time(recorder):
+    assert [start for start, _ in recorder.segments()] == [100.0, 110.0, 130.0]
+
+
+@pytest.mark.parametrize("ts, expected", [
+    (0, (0, 0)),         # Before the recording: its first frame
+    (100, (0, 0)),
+    (103, (0, 2)),       # Between two frames: the later one
+    (108.5, (1, 0)),     # After the last frame of a segment: the next segment
+    (110, (1, 0)),
+    (125, (2, 0)),       # In the gap
+    (138, (2, 4)),
+    (138.1, None),       # After the recording
+])
+def test_locate(recorder, ts, expected):
+    assert recorder.locate(ts) == expected
+
+
+@pytest.mark.parametrize("ts, expected_seq", [
+    (99.9, None),
+    (100, 0),
+    (103, 1),
+    (110, 5),
+    (125, 9),            # The gap shows the last frame before it
+    (1000, 14),
+])
+def test_state_at(recorder, ts, expected_seq):
+    state = recorder.state_at(ts)
+    if expected_seq is None:
+        assert state is None
+        return
+    frame_ts, meta, spaces = state
+    assert frame_ts <= ts
+    assert meta['seq'] == expected_seq
+    assert spaces == bytes([expected_seq])
+
+
+def test_frames_from_any_time(recorder):
+    frames = list(recorder.frames(107))
+    assert [meta['seq'] for _, meta, _, _ in frames] == list(range(4, 15))
+    assert [ts for ts, _, _, _ in frames][:3] == [108.0, 110.0, 112.0]
+    assert all(data == jpeg(meta['seq']) for _, meta, _, data in frames)
+    assert list(recorder.frames(139)) == []
+
+
+def test_skips_frames_too_close_or_out_of_order(tmp_path):
+    recorder = Recorder(str(tmp_path), max_fps=5)
+    assert recorder.record(10.0, {}, b"", b"a")
+    assert not recorder.record(10.1, {}, b"", b"b")
+    assert not recorder.record(9.0, {}, b"", b"c")
+    assert recorder.record(10.25, {}, None, b"d")
+    recorder.close()
+    assert [data for _, _, _, data in recorder.frames(0)] == [b"a", b"d"]
+
+
+def test_retention_keeps_the_newest_segments(tmp_path):
+    recorder = Recorder(str(tmp_path), segment_seconds=1, max_bytes=2500, max_fps=0)
+    for ts in range(10):
+        recorder.record(float(ts), {}, b"", bytes(1000))
+    recorder.close()
+    # Checked as each segment starts, so the limit can be exceeded by the segment being written
+    starts = [start for start, _ in recorder.segments()]
+    assert starts == [7.0, 8.0, 9.0]
+    assert len(os.listdir(tmp_path)) == 6
+    assert recorder.locate(0) == (0, 0)
+    assert recorder.state_at(5) is None
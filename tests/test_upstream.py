@@ -0,0 +1,55 @@
+import threading
+import time
+
+import pytest
+
+import upstream
+from metrics import Metrics, RollingWindow
+from upstream import Camera
+
+
+def packet(seq):
+    return {'seq': seq, 'capture_ts': 1000.0 + seq, 'frame': b'\xff\xd8' + bytes([seq % 256]),
+            'stats': {'total_spaces': 2, 'occupied_spaces': 1, 'free_spaces': 1}, 'spaces': bytes([0x80])}
+
+
+@pytest.fixture
+def camera(tmp_path, monkeypatch):
+    monkeypatch.setattr(upstream, "HISTORY_ROOT", str(tmp_path / "history"))
+    monkeypatch.setattr(upstream, "RECORDINGS_ROOT", str(tmp_path / "recordings"))
+    monkeypatch.setattr(upstream, "WRITE_QUEUE_SIZE", 8)
+    return Camera("cam", "localhost", 0, Metrics(), {'capture_to_server': RollingWindow()})
+
+
+def wait_idle(camera, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while camera.writes.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_writes_run_off_the_receive_thread(camera):
+    writers = []
+    for store in (camera.history, camera.recorder):
+        record = store.record
+        store.record = lambda *args, record=record: writers.append(threading.current_thread()) or record(*args)
+    camera.handle(packet(1), None)
+    wait_idle(camera)
+    assert len(writers) == 2 and threading.current_thread() not in writers
+    assert camera.recorder.state_at(1001.0)[1]['seq'] == 1
+    assert camera.history.transitions(0, time.time() + 1, None, 10)
+
+
+def test_slow_disk_drops_writes(camera):
+    release = threading.Event()
+    camera.history.record = lambda *args: release.wait()
+    start = time.monotonic()
+    for seq in range(20):
+        camera.handle(packet(seq), None)
+    assert time.monotonic() - start < 1.0
+    # Every packet still updated the camera
+    assert camera.frame[0] == 19
+    dropped = camera.write_dropped
+    assert dropped['history'] > 0 and dropped['record'] > 0
+    # Queued, plus the one the writer is blocked in
+    assert 2 * 20 - dropped['history'] - dropped['record'] <= 8 + 1
+    release.set()
@@ -0,0 +1,318 @@
+"""Receiving the streams of many producers on one thread.
+
+Each camera's producer (main1.py) sends length-prefixed pickled packets over
+TCP. An UpstreamLoop keeps one non-blocking connection per camera in a
+selector, parses packets as bytes arrive and hands complete ones to the
+camera. Every connection reconnects on its own with exponential backoff, so
+one unreachable camera never delays the others.
+
+The cameras are listed in `config/upstreams.json`:
+
+    {"north": {"host": "10.0.0.11", "port": 9999},
+     "south": {"host": "10.0.0.12", "port": 9999}}
+"""
+
+import errno
+import json
+import os
+import pickle
+import queue
+import random
+import selectors
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+from groups import space_stats
+from history import HistoryStore
+from recorder import Recorder
+
+UPSTREAMS_PATH = "config/upstreams.json"
+HISTORY_ROOT = "history"
+RECORDINGS_ROOT = "recordings"
+DEFAULT_CAMERA = "default"
+HEADER_SIZE = struct.calcsize("L")
+# Reconnect delays double from RECONNECT_MIN up to RECONNECT_MAX
+RECONNECT_MIN = 1.0
+RECONNECT_MAX = 30.0
+# A connection that is silent this long, or still connecting, is dropped
+STALL_TIMEOUT = 10.0
+# Writes waiting for a camera's writer thread, two per frame; writes beyond it are dropped
+WRITE_QUEUE_SIZE = 64
+
+
+def load_upstreams(default_host, default_port, path=UPSTREAMS_PATH):
+    """Return {camera: (host, port)}; without a config file, the single default producer."""
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                upstreams = json.load(f)
+            upstreams = {name: (entry['host'], int(entry['port'])) for name, entry in upstreams.items()}
+            if upstreams:
+                return upstreams
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Could not load upstreams {path}: {e}")
+    return {DEFAULT_CAMERA: (default_host, default_port)}
+
+
+def build_part(jpeg, seq, capture_ts):
+    """Build the multipart part of a frame, stamped with its sequence number and capture time"""
+    # The length lets the page read parts off the stream without scanning JPEG data for the boundary
+    headers = f'Content-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n'.encode()
+    if capture_ts is not None:
+        headers += f'X-Frame-Seq: {seq}\r\nX-Capture-Timestamp: {capture_ts:.6f}\r\n'.encode()
+    return b''.join((b'--frame\r\n', headers, b'\r\n', jpeg, b'\r\n'))
+
+
+class Camera:
+    """Latest frame, stats, history and recording of one producer."""
+
+    def __init__(self, name, host, port, metrics, latency):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.metrics = metrics
+        self.latency = latency
+        # (seq, capture time, JPEG, multipart part) of the latest frame, shared by every viewer
+        self.frame = None
+        self.frame_ready = threading.Condition()  # Notified with every new frame
+        self.stats = space_stats(0, 0)
+        self.groups = {}  # Counts of every space group
+        self.seq = None  # Producer sequence number of frame
+        self.capture_ts = None  # Producer capture time of frame
+        self.last_frame_time = None  # time.monotonic() of the last frame received
+        self.connected = False
+        self.connects = 0  # Connections made so far; the producer's seq restarts with each
+        # (seq, capture time, stats, groups) of the latest frame, replaced as a whole
+        self.state = None
+        self.producer_metrics = None  # Latest metrics snapshot forwarded by the producer
+        self.receive_backlog_bytes = 0  # Bytes of the packet being received, read so far
+        root = HISTORY_ROOT if name == DEFAULT_CAMERA else os.path.join(HISTORY_ROOT, name)
+        self.history = HistoryStore(root)
+        self.recorder = Recorder(os.path.join(RECORDINGS_ROOT, name))
+        # Disk writes run on the camera's own thread, never on the receive loop
+        self.writes = queue.Queue(WRITE_QUEUE_SIZE)
+        self.write_dropped = {'history': 0, 'record': 0}  # Writes dropped because the queue was full
+        threading.Thread(target=self._write_loop, daemon=True).start()
+
+    def is_ready(self, timeout):
+        """Return True while the producer delivers frames."""
+        return (self.connected and self.last_frame_time is not None
+                and time.monotonic() - self.last_frame_time < timeout)
+
+    def wait_frame(self, previous, timeout):
+        """Return the latest frame once it is not `previous`, or None after `timeout` seconds."""
+        with self.frame_ready:
+            if self.frame_ready.wait_for(lambda: self.frame is not previous, timeout):
+                return self.frame
+        return None
+
+    def handle(self, received_data, lap):
+        """Apply one packet from the producer."""
+        metrics = self.metrics
+        if received_data.get('metrics') is not None:
+            self.producer_metrics = received_data['metrics']
+
+        # The producer's JPEG is served as is: no decode and re-encode
+        seq = received_data.get('seq')
+        capture_ts = received_data.get('capture_ts')
+        jpeg = received_data['frame']
+        self.frame = (seq, capture_ts, jpeg, build_part(jpeg, seq, capture_ts))
+        with self.frame_ready:
+            self.frame_ready.notify_all()
+        self.seq, self.capture_ts = seq, capture_ts
+        self.last_frame_time = time.monotonic()
+        if capture_ts is not None:
+            self.latency['capture_to_server'].add(time.time() - capture_ts)
+        lap = metrics.lap('publish', lap)
+
+        # Update stats
+        stats = self.stats = received_data['stats']
+        if received_data.get('groups') is not None:
+            self.groups = {name: space_stats(total, occupied)
+                           for name, (total, occupied) in received_data['groups'].items()}
+        self.state = (seq, capture_ts, stats, self.groups)
+
+        # Record occupancy history, with per-space states when the producer sends them
+        states = None
+        if received_data.get('spaces') is not None:
+            states = np.unpackbits(np.frombuffer(received_data['spaces'], np.uint8),
+                                   count=stats['total_spaces']).astype(bool)
+        timed = lap is not None
+        self._queue_write('history', timed, self.history.record,
+                          (time.time(), stats['occupied_spaces'], stats['total_spaces'], states))
+
+        # Keep the frame as received for /replay
+        self._queue_write('record', timed, self.recorder.record,
+                          (capture_ts if capture_ts is not None else time.time(),
+                           {'seq': seq, 'stats': stats}, received_data.get('spaces'), jpeg))
+        metrics.lap('queue_writes', lap)
+        metrics.frame_done()
+
+    def _queue_write(self, stage, timed, write, args):
+        """Hand a write to the writer thread; a slow disk drops writes rather than stall the loop."""
+        try:
+            self.writes.put_nowait((stage, timed, write, args))
+        except queue.Full:
+            self.write_dropped[stage] += 1
+
+    def _write_loop(self):
+        """Run the queued writes of this camera in order; timed ones are observed as their stage."""
+        while True:
+            stage, timed, write, args = self.writes.get()
+            start = time.perf_counter()
+            try:
+                write(*args)
+            except Exception as e:
+                print(f"{self.name} {stage} write failed: {e}")
+            self.writes.task_done()
+            if timed:
+                self.metrics.observe(stage, time.perf_counter() - start)
+
+
+class Upstream:
+    """Non-blocking connection to the producer of one camera."""
+
+    def __init__(self, camera):
+        self.camera = camera
+        self.sock = None
+        self.connecting = False
+        self.backoff = RECONNECT_MIN
+        self.retry_at = 0.0
+        self.last_activity = 0.0
+        self.lap = None
+        self.header = bytearray(HEADER_SIZE)
+        # Reused for every packet, grown when a larger one arrives
+        self.body = bytearray(1 << 20)
+        self._expect_header()
+
+    def backlog(self):
+        """Bytes of the packet being received that were already read."""
+        if self.sock is None or self.connecting:
+            return 0
+        return self.filled if self.reading_header else HEADER_SIZE + self.filled
+
+    def _expect_header(self):
+        self.reading_header = True
+        self.view = memoryview(self.header)
+        self.filled = 0
+
+    def connect(self, selector):
+        camera = self.camera
+        print(f"Attempting to connect to {camera.name} stream at {camera.host}:{camera.port}...")
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setblocking(False)
+        self.connecting = True
+        self.last_activity = time.monotonic()
+        self._expect_header()
+        err = self.sock.connect_ex((camera.host, camera.port))
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            raise ConnectionError(os.strerror(err))
+        selector.register(self.sock, selectors.EVENT_WRITE, self)
+
+    def on_event(self, selector):
+        if self.connecting:
+            err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                raise ConnectionError(os.strerror(err))
+            self.connecting = False
+            self.last_activity = time.monotonic()
+            selector.modify(self.sock, selectors.EVENT_READ, self)
+            self.camera.connected = True
+            self.camera.connects += 1
+            self.camera.metrics.inc('connects_total')
+            print(f"Connected to {self.camera.name} stream")
+            return
+
+        # Read whatever is available, completing as many packets as it holds
+        while True:
+            try:
+                received = self.sock.recv_into(self.view[self.filled:])
+            except (BlockingIOError, InterruptedError):
+                return
+            if not received:
+                raise ConnectionError("Connection closed")
+            self.filled += received
+            self.last_activity = time.monotonic()
+            if self.filled == len(self.view):
+                self._complete()
+
+    def _complete(self):
+        metrics = self.camera.metrics
+        if self.reading_header:
+            msg_size = struct.unpack("L", self.header)[0]
+            self.lap = metrics.start_frame()
+            if len(self.body) < msg_size:
+                self.body = bytearray(msg_size)
+            self.reading_header = False
+            self.view = memoryview(self.body)[:msg_size]
+            self.filled = 0
+            if msg_size:
+                return
+
+        lap = metrics.lap('receive', self.lap)
+        metrics.inc('bytes_received_total', HEADER_SIZE + len(self.view))
+        received_data = pickle.loads(self.view)
+        self.view.release()
+        lap = metrics.lap('unpickle', lap)
+        self._expect_header()
+        self.camera.handle(received_data, lap)
+        # Reconnects start from the shortest delay again once data flows
+        self.backoff = RECONNECT_MIN
+
+    def close(self, selector, reason):
+        camera = self.camera
+        print(f"{camera.name} stream connection error: {reason}")
+        if self.sock is not None:
+            try:
+                selector.unregister(self.sock)
+            except (KeyError, ValueError):
+                pass
+            self.sock.close()
+            self.sock = None
+        self.connecting = False
+        camera.connected = False
+        # Jitter keeps many cameras from reconnecting in lockstep
+        self.retry_at = time.monotonic() + self.backoff * random.uniform(0.8, 1.2)
+        self.backoff = min(self.backoff * 2, RECONNECT_MAX)
+
+
+class UpstreamLoop:
+    """Receives the streams of every camera with one selector."""
+
+    def __init__(self, cameras, metrics):
+        self.selector = selectors.DefaultSelector()
+        self.upstreams = [Upstream(camera) for camera in cameras]
+        self.metrics = metrics
+
+    def run(self):
+        while True:
+            now = time.monotonic()
+            for upstream in self.upstreams:
+                if upstream.sock is None and now >= upstream.retry_at:
+                    try:
+                        upstream.connect(self.selector)
+                    except OSError as e:
+                        upstream.close(self.selector, e)
+                elif upstream.sock is not None and now - upstream.last_activity > STALL_TIMEOUT:
+                    upstream.close(self.selector, "no data received")
+
+            for key, mask in self.selector.select(self._timeout()):
+                upstream = key.data
+                try:
+                    upstream.on_event(self.selector)
+                except Exception as e:
+                    upstream.close(self.selector, e)
+            for upstream in self.upstreams:
+                # A backlog that stays high means the camera's packets arrive slower than they are sent
+                upstream.camera.receive_backlog_bytes = upstream.backlog()
+            self.metrics.set_gauge('connected', sum(u.camera.connected for u in self.upstreams))
+
+    def _timeout(self):
+        """Seconds until the next reconnect or stall check is due."""
+        now = time.monotonic()
+        due = [u.retry_at - now for u in self.upstreams if u.sock is None]
+        return min([1.0] + [max(0.0, d) for d in due])